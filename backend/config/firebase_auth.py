@@ -1,6 +1,17 @@
 import os
+import re
 import json
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+
+import jwt
+import requests
+from asgiref.sync import sync_to_async
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
 
 import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
@@ -8,6 +19,8 @@ from firebase_admin import credentials, auth as firebase_auth
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
 
+from config.metrics import external_call
+
 
 logger = logging.getLogger("config.firebase_auth")
 
@@ -43,6 +56,233 @@ def _initialize_admin():
 _initialize_admin()
 
 
+def _project_id():
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    try:
+        svc_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
+        svc_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
+        if svc_json:
+            return json.loads(svc_json).get("project_id")
+        if svc_path and os.path.exists(svc_path):
+            with open(svc_path) as fh:
+                return json.load(fh).get("project_id")
+    except Exception:
+        return None
+    return None
+
+
+# Project the ID tokens must be issued for; without it verification is
+# delegated to the Admin SDK
+PROJECT_ID = _project_id()
+
+# x509 certs Firebase signs ID tokens with, keyed by key id
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+# Used when the cert response carries no max-age
+DEFAULT_KEYS_MAX_AGE = 60 * 60
+# Start refreshing in the background this long before the keys expire
+KEYS_REFRESH_MARGIN = 5 * 60
+# Minimum spacing of synchronous refreshes triggered by an unknown key id
+KEYS_MIN_REFRESH_INTERVAL = 60
+# Seconds of clock skew allowed when checking exp/iat; the Admin SDK allows none
+CLOCK_SKEW = int(os.getenv("FIREBASE_AUTH_CLOCK_SKEW", "0"))
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def load_public_key(pem: str):
+    """Public key from a PEM encoded x509 certificate or public key"""
+    data = pem.encode()
+    if b"BEGIN CERTIFICATE" in data:
+        return x509.load_pem_x509_certificate(data).public_key()
+    return serialization.load_pem_public_key(data)
+
+
+class SigningKeyCache:
+    """Public keys for ID token signatures, keyed by key id.
+
+    Keys are fetched from Google and kept until the response's Cache-Control
+    max-age runs out; shortly before that they are refreshed in a background
+    thread while the current keys keep being served. Synchronous fetches (no
+    keys yet, or an unknown key id) are serialized, so concurrent requests
+    wait for one fetch instead of each making their own. With a local key set
+    (``set_local_keys``) nothing is ever fetched.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._local = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+        # held for the duration of a fetch from Google
+        self._fetch_lock = threading.Lock()
+
+    def set_local_keys(self, keys: dict):
+        """Serve ``{kid: pem}`` instead of Google's keys"""
+        loaded = {kid: load_public_key(pem) for kid, pem in keys.items()}
+        with self._lock:
+            self._keys = loaded
+            self._local = True
+
+    def reset(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._last_fetch = 0.0
+            self._local = False
+
+    def _needs_fetch(self, kid: str) -> bool:
+        # nothing to serve yet, or keys were rotated since the last fetch
+        return not self._keys or (
+            kid not in self._keys and time.time() - self._last_fetch >= KEYS_MIN_REFRESH_INTERVAL
+        )
+
+    def get(self, kid: str):
+        if self._local:
+            return self._keys.get(kid)
+        if self._needs_fetch(kid):
+            with self._fetch_lock:
+                # another request may have fetched while this one waited
+                if not self._local and self._needs_fetch(kid):
+                    self._fetch()
+        elif time.time() >= self._expires_at - KEYS_REFRESH_MARGIN:
+            self._refresh_in_background()
+        return self._keys.get(kid)
+
+    def refresh(self):
+        with self._fetch_lock:
+            self._fetch()
+
+    def _fetch(self):
+        self._last_fetch = time.time()
+        resp = requests.get(self.url, timeout=5)
+        resp.raise_for_status()
+        keys = {kid: load_public_key(pem) for kid, pem in resp.json().items()}
+        match = _MAX_AGE_RE.search(resp.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_KEYS_MAX_AGE
+        with self._lock:
+            if self._local:
+                return
+            self._keys = keys
+            self._expires_at = time.time() + max_age
+        logger.info("Loaded %d Firebase signing keys, max-age=%ds", len(keys), max_age)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as exc:
+                logger.warning("Refreshing Firebase signing keys failed: %s", exc)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="firebase-keys", daemon=True).start()
+
+
+signing_keys = SigningKeyCache(GOOGLE_CERTS_URL)
+
+# Optional JSON file of {kid: pem} to verify tokens against instead of
+# Google's keys, e.g. for a local token issuer during load tests
+_local_keys_path = os.getenv("FIREBASE_AUTH_KEYS_FILE")
+if _local_keys_path:
+    with open(_local_keys_path) as fh:
+        signing_keys.set_local_keys(json.load(fh))
+    logger.warning("Verifying Firebase ID tokens against local keys from %s", _local_keys_path)
+
+
+def verify_id_token(token: str) -> dict:
+    """Verify a Firebase ID token locally and return its claims.
+
+    Mirrors the Admin SDK checks (RS256, known key id, audience, issuer,
+    exp/iat, non-empty subject) and adds ``uid``.
+    """
+    if PROJECT_ID is None:
+        return firebase_auth.verify_id_token(token)
+
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") != "RS256":
+        raise jwt.InvalidAlgorithmError("ID token must be signed with RS256")
+    key = signing_keys.get(header.get("kid"))
+    if key is None:
+        raise jwt.InvalidKeyError("ID token signed with an unknown key")
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=["RS256"],
+        audience=PROJECT_ID,
+        issuer=f"https://securetoken.google.com/{PROJECT_ID}",
+        leeway=CLOCK_SKEW,
+        options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+    )
+    sub = claims["sub"]
+    if not isinstance(sub, str) or not sub or len(sub) > 128:
+        raise jwt.InvalidTokenError("ID token has an invalid subject")
+    claims["uid"] = sub
+    return claims
+
+
+class TokenCache:
+    """Thread-safe LRU cache of decoded ID tokens.
+
+    Entries are keyed by a SHA-256 of the token (raw tokens are never kept) and
+    expire at the token's ``exp`` claim, so a cached token is never accepted
+    for longer than Firebase itself would accept it.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            decoded, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decoded
+
+    def set(self, token: str, decoded: dict):
+        expires_at = decoded.get("exp")
+        if self.maxsize <= 0 or not expires_at or expires_at <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (decoded, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by all requests handled by this worker process
+token_cache = TokenCache(int(os.getenv("FIREBASE_TOKEN_CACHE_SIZE", "1024")))
+
+
 class FirebaseUser:
     """Lightweight user-like object representing a Firebase-authenticated user."""
 
@@ -67,28 +307,69 @@ class FirebaseAuthentication(BaseAuthentication):
     """
 
     def authenticate(self, request):
-        header = request.headers.get("Authorization") or request.META.get("HTTP_AUTHORIZATION")
-        if not header:
-            logger.debug("No Authorization header on request %s %s", request.method, request.get_full_path())
+        token = bearer_token(request)
+        if token is None:
             return None
 
-        parts = header.split()
-        if len(parts) != 2 or parts[0].lower() != "bearer":
-            logger.debug("Authorization header malformed: %r", header)
-            return None
+        decoded = token_cache.get(token)
+        if decoded is None:
+            try:
+                with external_call("firebase"):
+                    decoded = verify_id_token(token)
+            except Exception as exc:
+                logger.warning("Firebase token verification failed: %s", exc)
+                raise exceptions.AuthenticationFailed("Invalid Firebase ID token") from exc
+            token_cache.set(token, decoded)
+
+        return (user_from_claims(decoded), token)
+
+
+def bearer_token(request):
+    """Token from an `Authorization: Bearer <id-token>` header, or None."""
+    header = request.headers.get("Authorization") or request.META.get("HTTP_AUTHORIZATION")
+    if not header:
+        logger.debug("No Authorization header on request %s %s", request.method, request.get_full_path())
+        return None
+
+    parts = header.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        logger.debug("Authorization header malformed: %r", header)
+        return None
+
+    token = parts[1]
+    logger.debug("Received Authorization header, token length=%d", len(token))
+    return token
+
 
-        token = parts[1]
-        logger.debug("Received Authorization header, token length=%d", len(token))
+def user_from_claims(decoded: dict) -> FirebaseUser:
+    uid = decoded.get("uid")
+    email = decoded.get("email")
+    name = decoded.get("name")
+
+    logger.info("Firebase token verified: uid=%s email=%s", uid, email)
+    return FirebaseUser(uid=uid, email=email, name=name)
+
+
+async def authenticate_async(request):
+    """Async counterpart of `FirebaseAuthentication.authenticate` for plain Django async views.
+
+    Returns the FirebaseUser, or None if the request carries no bearer token.
+    Raises `AuthenticationFailed` for an invalid token. Cached tokens are
+    answered without leaving the event loop; verification (which may fetch
+    signing keys) runs in a worker thread.
+    """
+    token = bearer_token(request)
+    if token is None:
+        return None
+
+    decoded = token_cache.get(token)
+    if decoded is None:
         try:
-            decoded = firebase_auth.verify_id_token(token)
+            with external_call("firebase"):
+                decoded = await sync_to_async(verify_id_token, thread_sensitive=False)(token)
         except Exception as exc:
             logger.warning("Firebase token verification failed: %s", exc)
             raise exceptions.AuthenticationFailed("Invalid Firebase ID token") from exc
+        token_cache.set(token, decoded)
 
-        uid = decoded.get("uid")
-        email = decoded.get("email")
-        name = decoded.get("name")
-
-        logger.info("Firebase token verified: uid=%s email=%s", uid, email)
-        user = FirebaseUser(uid=uid, email=email, name=name)
-        return (user, token)
+    return user_from_claims(decoded)
@@ -0,0 +1,135 @@
+"""Logging plumbing for request paths: background writing, sampling, JSON.
+
+``BackgroundHandler`` only puts records on a bounded queue; a listener thread
+formats and writes them, so a request never waits on log I/O (when the queue
+is full records are dropped and counted rather than blocking).
+``SamplingFilter`` lets through one in ``every`` low-level records per message,
+for messages logged on every request. ``JsonFormatter`` writes one JSON
+object per line.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample_rate"}
+
+
+class BackgroundHandler(QueueHandler):
+    """Queue records for a writer thread that sends them to ``stream``.
+
+    The writer starts with the first record, in the process that logs it, so
+    the handler survives forking web servers.
+    """
+
+    def __init__(self, stream=None, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # records are formatted by the writer thread, not the caller
+        self.target.setFormatter(fmt)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def prepare(self, record):
+        # Merge args now (they may change after the call returns); formatting
+        # is left to the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until every queued record has been written."""
+        if self._pid == os.getpid():
+            self.queue.join()
+        self.target.flush()
+
+    def close(self):
+        if self._pid == os.getpid() and self._listener is not None:
+            self._listener.stop()
+            self._pid = None
+        self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """Pass one in ``every`` records at or below ``max_level``, counted per message.
+
+    Counting per message template keeps rare messages of the same logger from
+    being sampled away by a noisy one. Passed records get ``sample_rate`` so
+    consumers can scale counts back up. Higher levels always pass.
+    """
+
+    def __init__(self, every: int = 100, max_level="INFO"):
+        super().__init__()
+        self.every = max(int(every), 1)
+        self.max_level = max_level if isinstance(max_level, int) else logging.getLevelName(max_level)
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.every == 1:
+            return True
+        counter = self._counters.get(record.msg)
+        if counter is None:
+            counter = self._counters.setdefault(record.msg, count())
+        # next() on itertools.count is atomic, so no lock is needed
+        if next(counter) % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extras, exception."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate:
+            entry["sample_rate"] = sample_rate
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
@@ -0,0 +1,303 @@
+"""Request metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, per route (the URL name), request latency,
+the number of SQL queries and the time spent in them, time spent in external
+calls (Firebase, blockchain RPC) and response size. ``metrics_view`` exposes
+them for scraping.
+
+Metrics live in process memory and are updated under a lock, so they are
+safe across request threads and the event loop. Each worker process keeps its
+own series; scrape every worker (or run one per container).
+"""
+import contextvars
+import hmac
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, *label_values, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def totals(self, *label_values):
+        """``(count, sum)`` of the observations with these label values."""
+        with self._lock:
+            state = self._values.get(label_values)
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.register(
+    Counter("http_requests_total", "HTTP requests by route, method and status.", ["route", "method", "status"])
+)
+request_duration = registry.register(
+    Histogram("http_request_duration_seconds", "Request latency.", ["route", "method"])
+)
+request_queries = registry.register(
+    Histogram("http_request_db_queries", "SQL queries per request.", ["route"], QUERY_COUNT_BUCKETS)
+)
+request_db_duration = registry.register(
+    Histogram("http_request_db_duration_seconds", "Time spent in SQL queries per request.", ["route"])
+)
+request_external_duration = registry.register(
+    Histogram(
+        "http_request_external_duration_seconds",
+        "Time spent in external calls per request.",
+        ["route", "service"],
+    )
+)
+response_size = registry.register(
+    Histogram("http_response_size_bytes", "Response body size.", ["route"], SIZE_BUCKETS)
+)
+external_call_duration = registry.register(
+    Histogram(
+        "external_call_duration_seconds",
+        "External calls, inside requests or not, by service and outcome.",
+        ["service", "outcome"],
+    )
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "external")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.external = {}
+
+
+# Stats of the request being handled; asgiref carries it into sync_to_async threads
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install_query_recorder)
+
+
+@contextmanager
+def external_call(service: str):
+    """Time an external call (``with external_call("rpc"): ...``), also around ``await``."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        external_call_duration.observe(service, outcome, value=elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.external[service] = stats.external.get(service, 0.0) + elapsed
+
+
+def _route(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name if match else None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Records per-route latency, SQL and external call time and response size."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, stats, elapsed):
+        route = _route(request)
+        requests_total.inc(route, request.method, str(response.status_code))
+        request_duration.observe(route, request.method, value=elapsed)
+        request_queries.observe(route, value=stats.queries)
+        request_db_duration.observe(route, value=stats.db_time)
+        for service, seconds in stats.external.items():
+            request_external_duration.observe(route, service, value=seconds)
+
+        if not response.streaming:
+            response_size.observe(route, value=len(response.content))
+        elif response.is_async:
+            response.streaming_content = self._acount(response.streaming_content, route)
+        else:
+            response.streaming_content = self._count(response.streaming_content, route)
+
+    @staticmethod
+    def _count(chunks, route):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            response_size.observe(route, value=size)
+
+    @staticmethod
+    async def _acount(chunks, route):
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            response_size.observe(route, value=size)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>`` when that is set."""
+    token = settings.METRICS_TOKEN
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
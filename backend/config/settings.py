@@ -89,6 +89,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -132,6 +133,33 @@ DATABASES = {
 }
 
 
+# Cache (display names, ...). Defaults to a per-process memory cache; set
+# DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION to share it between workers.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+
+# Bearer token required to scrape /metrics; leave empty to serve it openly
+# (e.g. when it is only reachable from inside the cluster)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# Seconds the leaderboard snapshot (``refresh_leaderboard``) is served for;
+# an older snapshot is ignored and the ranking is computed live
+LEADERBOARD_MAX_AGE = int(os.getenv("LEADERBOARD_MAX_AGE", "900"))
+
+
+# Views declare query budgets (habits.api.query_budget); going over one logs a
+# warning, or raises when this is set (the test suite turns it on)
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "").lower() in {"1", "true", "yes"}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -163,17 +191,42 @@ USE_I18N = True
 USE_TZ = True
 
 
-# Logging – show Firebase auth debug messages in the console
+# Logging – JSON lines written by a background thread (config/log.py), so
+# request threads never block on log I/O. Firebase auth logs every request at
+# INFO; only one in AUTH_LOG_SAMPLE_EVERY of those is kept per message
+# (warnings always are). AUTH_LOG_LEVEL=DEBUG brings back the debug messages.
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "config.log.JsonFormatter"},
+    },
+    "filters": {
+        "sample_auth": {
+            "()": "config.log.SamplingFilter",
+            "every": int(os.getenv("AUTH_LOG_SAMPLE_EVERY", "100")),
+        },
+    },
     "handlers": {
-        "console": {"class": "logging.StreamHandler"},
+        "background": {
+            "()": "config.log.BackgroundHandler",
+            "formatter": "json",
+        },
     },
     "loggers": {
+        "config": {
+            "handlers": ["background"],
+            "level": "INFO",
+            "propagate": False,
+        },
         "config.firebase_auth": {
-            "handlers": ["console"],
-            "level": "DEBUG",
+            "level": os.getenv("AUTH_LOG_LEVEL", "INFO"),
+            "filters": ["sample_auth"],
+        },
+        "habits": {
+            "handlers": ["background"],
+            "level": "INFO",
+            "propagate": False,
         },
     },
 }
@@ -1,5 +1,18 @@
 from django.contrib import admin
-from .models import CheckIn, Habit, UserStats, Subscription
+from django.db import transaction
+
+from .checkin_service import record_checkin, remove_checkin
+from .subscription_service import invalidate_entitlement
+from .models import (
+    CheckIn,
+    DailyCheckInCount,
+    Habit,
+    IndexerCheckpoint,
+    LeaderboardEntry,
+    UserStats,
+    Subscription,
+    SubscriptionPayment,
+)
 
 
 @admin.register(Habit)
@@ -9,14 +22,57 @@ class HabitAdmin(admin.ModelAdmin):
     search_fields = ("name", "user_id", "description")
     readonly_fields = ("created_at",)
 
+    def delete_model(self, request, obj):
+        # the cascade removes the habit's check-ins; keep the daily rollup in sync
+        dates = list(obj.checkins.values_list("date", flat=True))
+        obj.delete()
+        if dates:
+            DailyCheckInCount.rebuild(user_id=obj.user_id, dates=dates)
+        invalidate_entitlement(obj.user_id)
+        UserStats.bump_data_version(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
+
 
 @admin.register(CheckIn)
 class CheckInAdmin(admin.ModelAdmin):
+    """Adds and deletes go through checkin_service, like the API."""
+
     list_display = ("habit", "user_id", "date", "created_at")
     list_filter = ("date", "created_at")
     search_fields = ("habit__name", "user_id")
     readonly_fields = ("created_at",)
 
+    def get_readonly_fields(self, request, obj=None):
+        # moving a check-in would need its streak and XP redone; delete and re-add instead
+        if obj is not None:
+            return ("habit", "user_id", "date", "created_at")
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return
+        with transaction.atomic():
+            obj.user_id = obj.habit.user_id
+            obj.save()
+            record_checkin(obj)
+
+    def delete_model(self, request, obj):
+        remove_checkin(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            remove_checkin(obj)
+
+
+@admin.register(DailyCheckInCount)
+class DailyCheckInCountAdmin(admin.ModelAdmin):
+    list_display = ("user_id", "date", "count")
+    list_filter = ("date",)
+    search_fields = ("user_id",)
+
 
 @admin.register(UserStats)
 class UserStatsAdmin(admin.ModelAdmin):
@@ -26,6 +82,12 @@ class UserStatsAdmin(admin.ModelAdmin):
     readonly_fields = ("updated_at",)
 
 
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ("rank", "user_id", "display_name", "xp_total", "refreshed_at")
+    search_fields = ("user_id", "display_name")
+
+
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = (
@@ -59,3 +121,15 @@ class SubscriptionAdmin(admin.ModelAdmin):
             }
         ),
     )
+
+
+@admin.register(SubscriptionPayment)
+class SubscriptionPaymentAdmin(admin.ModelAdmin):
+    list_display = ("buyer", "tx_hash", "block_number", "amount_wei", "paid_at")
+    search_fields = ("buyer", "tx_hash")
+    readonly_fields = ("indexed_at",)
+
+
+@admin.register(IndexerCheckpoint)
+class IndexerCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("name", "block_number", "updated_at")
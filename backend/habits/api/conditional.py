@@ -0,0 +1,52 @@
+import hashlib
+from datetime import datetime, time
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+from ..models import UserStats
+
+
+def conditional_user_data(view_func):
+    """Answer GET requests with 304 when the user's data has not changed.
+
+    The ETag is derived from ``UserStats.data_version``, the request path and
+    today's date (streaks and "today" flags change at midnight), so a
+    revalidation costs a single lookup and never touches the check-in tables.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        uid = getattr(request.user, "uid", None)
+        if request.method not in ("GET", "HEAD") or not uid:
+            return view_func(request, *args, **kwargs)
+
+        row = UserStats.objects.filter(user_id=uid).values_list("data_version", "updated_at").first()
+        version, updated_at = row or (0, None)
+        today = timezone.localdate()
+        raw = f"{uid}:{version}:{today.isoformat()}:{request.get_full_path()}"
+        etag = quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+        midnight = timezone.make_aware(datetime.combine(today, time.min))
+        last_modified = int(max(updated_at or midnight, midnight).timestamp())
+
+        if_none_match = request.headers.get("If-None-Match")
+        if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            not_modified = etag in etags or "*" in etags
+        else:
+            not_modified = if_modified_since is not None and if_modified_since >= last_modified
+
+        response = Response(status=304) if not_modified else view_func(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_vary_headers(response, ["Authorization"])
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,98 @@
+import contextvars
+import logging
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Statements run by the view being measured; carried into sync_to_async threads
+_statements = contextvars.ContextVar("query_budget_statements", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _record_statement(execute, sql, params, many, context):
+    statements = _statements.get()
+    if statements is not None:
+        statements.append(sql)
+    return execute(sql, params, many, context)
+
+
+def _install_recorder(connection, **kwargs):
+    if _record_statement not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_statement)
+
+
+connection_created.connect(_install_recorder)
+
+
+def _check(name, limit, statements):
+    if len(statements) <= limit:
+        return
+    listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(statements, start=1))
+    message = f"{name} ran {len(statements)} queries, budget is {limit}:\n{listing}"
+    if settings.QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(limit: int):
+    """Declare the most SQL queries a view may run (sync or async views).
+
+    Counts the queries made while the view runs, including ones made by
+    decorators below this one (put it above ``conditional_user_data`` so the
+    ETag lookup is counted); bodies of streamed responses are produced later
+    and are not. Going over logs a warning listing the statements, or raises
+    ``QueryBudgetExceeded`` when ``settings.QUERY_BUDGET_RAISE`` is set, as the
+    test suite does.
+    """
+
+    def decorator(view_func):
+        name = view_func.__qualname__
+
+        def start():
+            for connection in connections.all(initialized_only=True):
+                _install_recorder(connection)
+            return [], _statements.get()
+
+        def finish(statements, outer, token):
+            _statements.reset(token)
+            if outer is not None:
+                # an enclosing budget counts these queries as well
+                outer.extend(statements)
+
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(*args, **kwargs):
+                statements, outer = start()
+                token = _statements.set(statements)
+                try:
+                    response = await view_func(*args, **kwargs)
+                finally:
+                    finish(statements, outer, token)
+                _check(name, limit, statements)
+                return response
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            statements, outer = start()
+            token = _statements.set(statements)
+            try:
+                response = view_func(*args, **kwargs)
+            finally:
+                finish(statements, outer, token)
+            _check(name, limit, statements)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,12 @@
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
-from ..models import CheckIn, Habit
+from rest_framework.serializers import (
+    DateField,
+    IntegerField,
+    ListField,
+    ModelSerializer,
+    Serializer,
+    SerializerMethodField,
+)
+from ..models import CheckIn, DailyCheckInCount, Habit, get_color_for_count
 
 
 class HabitSerializer(ModelSerializer):
@@ -20,11 +27,18 @@ class HabitSerializer(ModelSerializer):
         )
         read_only_fields = ("user_id",)
 
+    def _streaks(self, obj):
+        # list views precompute streaks for every habit in one pass
+        streaks = self.context.get("streaks")
+        if streaks is not None and obj.pk in streaks:
+            return streaks[obj.pk]
+        return obj.current_streak(), obj.longest_streak()
+
     def get_current_streak(self, obj):
-        return obj.current_streak()
+        return self._streaks(obj)[0]
 
     def get_longest_streak(self, obj):
-        return obj.longest_streak()
+        return self._streaks(obj)[1]
 
 
 class CheckInSerializer(ModelSerializer):
@@ -36,4 +50,24 @@ class CheckInSerializer(ModelSerializer):
         read_only_fields = ("user_id",)
 
     def get_color(self, obj):
-        return obj.color()
+        # list views pass the user's per-day counts for the listed dates
+        counts = self.context.get("daily_counts")
+        if counts is not None:
+            count = counts.get(obj.date, 0)
+        else:
+            count = (
+                DailyCheckInCount.objects.filter(user_id=obj.user_id, date=obj.date)
+                .values_list("count", flat=True)
+                .first()
+                or 0
+            )
+        return get_color_for_count(count)
+
+
+class BulkCheckInItemSerializer(Serializer):
+    habit = IntegerField()
+    date = DateField()
+
+
+class BulkCheckInSerializer(Serializer):
+    checkins = ListField(child=BulkCheckInItemSerializer(), allow_empty=False, max_length=5000)
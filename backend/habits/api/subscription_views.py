@@ -1,17 +1,40 @@
+import json
+import os
+
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.views import APIView
-from ..subscription_service import get_subscription_service
+from config.firebase_auth import authenticate_async
+from ..subscription_service import FREE_TIER_LIMIT, get_subscription_service
 from ..models import Subscription
 from .subscription_serializers import SubscriptionSerializer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# subscription_status, subscription_info and the register view are plain async
+# Django views: under ASGI a slow RPC node or Firebase call parks a coroutine
+# instead of a worker thread
 
-@api_view(["GET"])
-def subscription_status(request):
+
+async def _authenticated_uid(request):
+    """Returns (uid, None) or (None, error response)"""
+    try:
+        user = await authenticate_async(request)
+    except AuthenticationFailed as e:
+        return None, JsonResponse({"detail": str(e.detail)}, status=403)
+    if user is None or not user.uid:
+        return None, JsonResponse({"detail": "Authentication required"}, status=401)
+    return user.uid, None
+
+
+@require_GET
+async def subscription_status(request):
     """
     Get current subscription status for authenticated user
     
@@ -22,14 +45,14 @@ def subscription_status(request):
         - tx_hash: string or null (proof of payment on blockchain)
         - created_at: timestamp
     """
-    uid = getattr(request.user, "uid", None)
-    if not uid:
-        return Response({"detail": "Authentication required"}, status=401)
+    uid, error = await _authenticated_uid(request)
+    if error:
+        return error
 
     service = get_subscription_service()
-    status = service.get_subscription_status(uid)
+    status = await service.aget_subscription_status(uid)
 
-    return Response(status)
+    return JsonResponse(status)
 
 
 @api_view(["GET"])
@@ -49,20 +72,18 @@ def can_create_habit(request):
 
     service = get_subscription_service()
     can_create, reason = service.can_create_habit(uid)
-
-    # Get current habit count
-    from ..models import Habit
-    habit_count = Habit.objects.filter(user_id=uid).count()
+    habit_count = service.get_entitlement(uid)["habit_count"]
 
     return Response({
         "can_create": can_create,
         "reason": reason,
         "current_habits": habit_count,
-        "free_tier_limit": 5,
+        "free_tier_limit": FREE_TIER_LIMIT,
     })
 
 
-class SubscriptionRegistrationView(APIView):
+@method_decorator(csrf_exempt, name="dispatch")
+class SubscriptionRegistrationView(View):
     """
     Register a blockchain subscription after payment
     
@@ -72,57 +93,62 @@ class SubscriptionRegistrationView(APIView):
         "tx_hash": "0x..."
     }
     """
-    permission_classes = [IsAuthenticated]
+    http_method_names = ["post"]
 
-    def post(self, request):
+    async def post(self, request):
         try:
-            uid = getattr(request.user, "uid", None)
-            if not uid:
-                return Response(
-                    {"detail": "Authentication required"},
-                    status=401
-                )
+            uid, error = await _authenticated_uid(request)
+            if error:
+                return error
 
-            wallet_address = request.data.get("wallet_address")
-            tx_hash = request.data.get("tx_hash")
+            if request.content_type == "application/json":
+                try:
+                    data = json.loads(request.body or b"{}")
+                except ValueError:
+                    return JsonResponse({"detail": "Invalid JSON body"}, status=400)
+            else:
+                data = request.POST
+
+            wallet_address = data.get("wallet_address")
+            tx_hash = data.get("tx_hash")
 
             if not wallet_address:
-                return Response(
+                return JsonResponse(
                     {"detail": "wallet_address is required"},
                     status=400
                 )
 
             if not tx_hash:
-                return Response(
+                return JsonResponse(
                     {"detail": "tx_hash is required"},
                     status=400
                 )
 
             service = get_subscription_service()
-            subscription = service.register_subscription(
+            subscription = await service.aregister_subscription(
                 uid,
                 wallet_address,
                 tx_hash
             )
 
             serializer = SubscriptionSerializer(subscription)
-            return Response(serializer.data, status=201)
+            return JsonResponse(serializer.data, status=201)
 
         except ValueError as e:
-            return Response(
+            return JsonResponse(
                 {"detail": str(e)},
                 status=400
             )
         except Exception as e:
             logger.error(f"Error registering subscription: {e}")
-            return Response(
+            return JsonResponse(
                 {"detail": "Internal server error"},
                 status=500
             )
 
 
-@api_view(["GET"])
-def subscription_info(request):
+@require_GET
+async def subscription_info(request):
     """
     Get subscription information and pricing
     
@@ -133,13 +159,11 @@ def subscription_info(request):
         - contract_network: blockchain network
         - purchase_type: 'one-time'
     """
-    import os
-    
     service = get_subscription_service()
-    price = service.get_subscription_price()
+    price = await service.aget_subscription_price()
     
-    return Response({
-        "free_tier_limit": 5,
+    return JsonResponse({
+        "free_tier_limit": FREE_TIER_LIMIT,
         "price": price or "0.1",  # Default to 0.1 ETH if not available
         "premium_features": [
             "Unlimited habits",
@@ -150,4 +174,3 @@ def subscription_info(request):
         "contract_network": os.getenv("SUBSCRIPTION_NETWORK", "polygon"),
         "purchase_type": "one-time",
     })
-
@@ -1,6 +1,15 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import CheckInViewSet, HabitViewSet, heatmap, leaderboard, stats, xp
+from .views import (
+    CheckInViewSet,
+    HabitViewSet,
+    export,
+    heatmap,
+    leaderboard,
+    leaderboard_me,
+    stats,
+    xp,
+)
 from .subscription_views import (
     subscription_status,
     can_create_habit,
@@ -17,7 +26,9 @@ urlpatterns = [
     path("heatmap/", heatmap, name="heatmap"),
     path("stats/", stats, name="stats"),
     path("xp/", xp, name="xp"),
+    path("export/", export, name="export"),
     path("leaderboard/", leaderboard, name="leaderboard"),
+    path("leaderboard/me/", leaderboard_me, name="leaderboard_me"),
     # Subscription endpoints
     path("subscriptions/status/", subscription_status, name="subscription_status"),
     path("subscriptions/can-create-habit/", can_create_habit, name="can_create_habit"),
@@ -1,16 +1,50 @@
+import base64
+import json
 from datetime import date, timedelta
 
-from django.db.models import Count
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.dateparse import parse_date
-from rest_framework.decorators import api_view
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from ..models import CheckIn, Habit, UserStats, XpEvent, get_color_for_count
-from .serializers import CheckInSerializer, HabitSerializer
+from ..models import (
+    CheckIn,
+    DailyCheckInCount,
+    Habit,
+    LeaderboardEntry,
+    UserStats,
+    get_color_for_count,
+    habit_streaks,
+)
+from .conditional import conditional_user_data
+from .query_budget import query_budget
+from .serializers import BulkCheckInSerializer, CheckInSerializer, HabitSerializer
 from rest_framework.permissions import IsAuthenticated
-from firebase_admin import auth as firebase_auth
+from ..checkin_import import CheckInImportError, decode_lines, import_checkins
+from ..checkin_service import record_checkin, record_checkins, remove_checkin
+from ..display_names import acached_display_names, cached_display_names, request_display_names
+from ..export import EXPORT_FORMATS, aexport_rows, export_rows
+from ..subscription_service import invalidate_entitlement
+
+
+def parse_date_param(value):
+    """Date of a YYYY-MM-DD query param; None when missing or not a real date."""
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        # well formed but impossible, e.g. 2026-02-30
+        return None
 
 
 def get_rank_for_xp(xp_total: int):
@@ -68,6 +102,15 @@ class HabitViewSet(ModelViewSet):
             return Habit.objects.none()
         return Habit.objects.filter(user_id=uid)
 
+    @method_decorator(query_budget(4))
+    @method_decorator(conditional_user_data)
+    def list(self, request, *args, **kwargs):
+        habits = list(self.filter_queryset(self.get_queryset()))
+        context = self.get_serializer_context()
+        context["streaks"] = habit_streaks(habits)
+        serializer = self.get_serializer(habits, many=True, context=context)
+        return Response(serializer.data)
+
     def perform_create(self, serializer):
         uid = getattr(self.request.user, "uid", None)
 
@@ -77,11 +120,44 @@ class HabitViewSet(ModelViewSet):
 
         service = get_subscription_service()
         can_create, reason = service.can_create_habit(uid or "")
+        if not can_create:
+            # the cached entitlement may predate an upgrade handled by another worker
+            can_create, reason = service.can_create_habit(uid or "", fresh=True)
 
         if not can_create:
             raise ValidationError({"detail": reason})
 
         serializer.save(user_id=uid or "")
+        invalidate_entitlement(uid or "")
+        UserStats.bump_data_version(uid or "")
+
+    def perform_update(self, serializer):
+        habit = serializer.save()
+        UserStats.bump_data_version(habit.user_id)
+
+    def perform_destroy(self, instance):
+        # the cascade removes the habit's check-ins; keep the daily rollup in sync
+        dates = list(instance.checkins.values_list("date", flat=True))
+        instance.delete()
+        if dates:
+            DailyCheckInCount.rebuild(user_id=instance.user_id, dates=dates)
+        invalidate_entitlement(instance.user_id)
+        UserStats.bump_data_version(instance.user_id)
+
+
+# Check-ins per page of GET /api/checkins/
+CHECKIN_PAGE_SIZE = 100
+CHECKIN_MAX_PAGE_SIZE = 500
+
+
+def parse_checkin_cursor(cursor):
+    """``(date, id)`` from a check-in ``next_cursor`` ("YYYY-MM-DD.id"), or None."""
+    date_str, _, id_str = cursor.partition(".")
+    day = parse_date_param(date_str)
+    try:
+        return (day, int(id_str)) if day else None
+    except ValueError:
+        return None
 
 
 class CheckInViewSet(ModelViewSet):
@@ -97,6 +173,79 @@ class CheckInViewSet(ModelViewSet):
             return CheckIn.objects.none()
         return CheckIn.objects.filter(user_id=uid)
 
+    @method_decorator(query_budget(4))
+    @method_decorator(conditional_user_data)
+    def list(self, request, *args, **kwargs):
+        """Return the user's check-ins newest first, one page at a time.
+
+        Pages are keyset-paginated on (date, id), so each page costs the same
+        however long the user's history is.
+
+        Query params:
+            from   - optional first date (YYYY-MM-DD)
+            to     - optional last date (YYYY-MM-DD)
+            habit  - optional habit id
+            limit  - optional page size (default CHECKIN_PAGE_SIZE, max CHECKIN_MAX_PAGE_SIZE)
+            cursor - optional ``next_cursor`` of the previous page
+        """
+        qs = self.filter_queryset(self.get_queryset()).order_by("-date", "-id")
+
+        try:
+            limit = int(request.GET.get("limit", CHECKIN_PAGE_SIZE))
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+        if limit < 1:
+            return Response({"detail": "limit must be >= 1"}, status=400)
+        limit = min(limit, CHECKIN_MAX_PAGE_SIZE)
+
+        from_str = request.GET.get("from")
+        to_str = request.GET.get("to")
+        start = parse_date_param(from_str)
+        end = parse_date_param(to_str)
+        if (from_str and not start) or (to_str and not end):
+            return Response({"detail": "from and to must be dates (YYYY-MM-DD)"}, status=400)
+        if start:
+            qs = qs.filter(date__gte=start)
+        if end:
+            qs = qs.filter(date__lte=end)
+
+        habit_str = request.GET.get("habit")
+        if habit_str:
+            try:
+                qs = qs.filter(habit_id=int(habit_str))
+            except ValueError:
+                return Response({"detail": "habit must be an integer"}, status=400)
+
+        cursor = request.GET.get("cursor")
+        if cursor:
+            position = parse_checkin_cursor(cursor)
+            if position is None:
+                return Response({"detail": "cursor is invalid"}, status=400)
+            cursor_date, cursor_id = position
+            qs = qs.filter(Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id))
+
+        checkins = list(qs[: limit + 1])
+        has_more = len(checkins) > limit
+        checkins = checkins[:limit]
+
+        context = self.get_serializer_context()
+        context["daily_counts"] = {}
+        if checkins:
+            context["daily_counts"] = dict(
+                DailyCheckInCount.objects.filter(
+                    user_id=checkins[0].user_id, date__range=(checkins[-1].date, checkins[0].date)
+                ).values_list("date", "count")
+            )
+        serializer = self.get_serializer(checkins, many=True, context=context)
+        last = checkins[-1] if checkins else None
+        return Response(
+            {
+                "count": len(checkins),
+                "results": serializer.data,
+                "next_cursor": f"{last.date.isoformat()}.{last.pk}" if has_more else None,
+            }
+        )
+
     def perform_create(self, serializer):
         # ensure the habit belongs to the current user
         uid = getattr(self.request.user, "uid", None) or ""
@@ -105,73 +254,174 @@ class CheckInViewSet(ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
 
             raise PermissionDenied("Cannot add checkin for a habit you do not own")
-        checkin = serializer.save(user_id=uid)
 
-        # Award XP once per habit/day (base + streak milestones)
-        xp_event, xp_created = XpEvent.objects.get_or_create(
-            user_id=uid, habit=habit, date=checkin.date
+        # Check-in, streak, daily count and XP award (once per habit/day) commit together
+        try:
+            with transaction.atomic():
+                checkin = serializer.save(user_id=uid)
+                record_checkin(checkin, display_name=self._display_name_from_token())
+        except IntegrityError:
+            from rest_framework.exceptions import ValidationError
+
+            raise ValidationError({"detail": "Already checked in for this habit on this date"})
+
+    def perform_destroy(self, instance):
+        remove_checkin(instance)
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """Create many check-ins at once (e.g. replaying offline check-ins).
+
+        Body: {"checkins": [{"habit": <id>, "date": "YYYY-MM-DD"}, ...]}
+        Existing check-ins are skipped. Returns {created, skipped, xp_awarded}.
+        """
+        uid = getattr(request.user, "uid", None)
+        if not uid:
+            return Response({"detail": "Authentication required"}, status=401)
+
+        serializer = BulkCheckInSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        entries = {(item["habit"], item["date"]) for item in serializer.validated_data["checkins"]}
+        try:
+            created, xp_awarded = record_checkins(
+                uid, entries, display_name=self._display_name_from_token()
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        return Response(
+            {"created": created, "skipped": len(entries) - created, "xp_awarded": xp_awarded},
+            status=201,
         )
 
-        stats, created = UserStats.objects.get_or_create(user_id=uid)
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_csv(self, request):
+        """Import check-in history from CSV, all or nothing.
 
+        Body: a ``text/csv`` request body, or a multipart upload in ``file``.
+        Columns ``habit,date`` (optionally ``color,description``), or the CSV
+        produced by /api/export/. Missing habits are created by name.
+        Returns {rows, habits_created, created, skipped, xp_awarded}.
+        """
+        uid = getattr(request.user, "uid", None)
+        if not uid:
+            return Response({"detail": "Authentication required"}, status=401)
+
+        # read the body as it arrives rather than through request.data
+        if request.content_type.startswith("text/csv"):
+            source = request._request
+        else:
+            source = request.FILES.get("file")
+            if source is None:
+                return Response({"detail": "Send text/csv or a multipart 'file'"}, status=400)
+        try:
+            result = import_checkins(uid, decode_lines(source), display_name=self._display_name_from_token())
+        except UnicodeDecodeError:
+            return Response({"detail": "The file must be UTF-8 encoded"}, status=400)
+        except CheckInImportError as e:
+            return Response({"detail": str(e)}, status=400)
+        return Response(result, status=201)
+
+    def _display_name_from_token(self):
         # Save display name from the token if available
         name_from_token = getattr(self.request.user, "name", None)
         if not name_from_token:
             email_from_token = getattr(self.request.user, "email", None)
             if email_from_token and "@" in email_from_token:
                 name_from_token = email_from_token.split("@")[0]
+        return name_from_token or ""
+
+
+# Upper bound for compact heatmap ranges (the verbose format is capped at 1 year)
+HEATMAP_COMPACT_MAX_YEARS = 20
 
-        if name_from_token:
-            stats.display_name = name_from_token
-
-        if xp_created:
-            base_xp = 10
-            milestones = {
-                5: 20,
-                10: 40,
-                20: 80,
-                50: 200,
-                100: 500,
-                150: 800,
-                200: 1000,
-            }
-            streak = habit.current_streak()
-            bonus = milestones.get(streak, 0)
-            stats.xp_total += base_xp + bonus
 
-        stats.save(update_fields=["xp_total", "display_name", "updated_at"])
+def encode_heatmap_counts(start, days, counts):
+    """Pack ``days`` daily counts beginning at ``start`` into a base64 string.
+
+    Returns ``(encoding, data)``. When every day has at most one check-in the
+    days are packed as a bitset (bit ``i % 8`` of byte ``i // 8`` is day ``i``),
+    otherwise as one byte per day with counts capped at 255.
+    """
+    values = [counts.get(start + timedelta(days=i), 0) for i in range(days)]
+    if max(values, default=0) <= 1:
+        packed = bytearray((days + 7) // 8)
+        for i, value in enumerate(values):
+            if value:
+                packed[i >> 3] |= 1 << (i & 7)
+        return "bitset", base64.b64encode(bytes(packed)).decode()
+    return "counts", base64.b64encode(bytes(min(v, 255) for v in values)).decode()
+
+
+def _compact_heatmap_chunks(uid, start, end):
+    """Yield the compact heatmap JSON document one calendar year at a time."""
+    yield f'{{"from": "{start.isoformat()}", "to": "{end.isoformat()}", "chunks": ['
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, date(chunk_start.year, 12, 31))
+        counts = dict(
+            DailyCheckInCount.objects.filter(
+                user_id=uid, date__range=(chunk_start, chunk_end)
+            ).values_list("date", "count")
+        )
+        days = (chunk_end - chunk_start).days + 1
+        encoding, data = encode_heatmap_counts(chunk_start, days, counts)
+        chunk = {"start": chunk_start.isoformat(), "days": days, "encoding": encoding, "data": data}
+        yield ("" if chunk_start == start else ", ") + json.dumps(chunk)
+        chunk_start = chunk_end + timedelta(days=1)
+    yield "]}"
 
 
 @api_view(["GET"])
+@query_budget(3)
+@conditional_user_data
 def heatmap(request):
     """Return a list of dates with check-in counts and associated colors.
 
     Query params:
-      from  - start date (YYYY-MM-DD)
-      to    - end date (YYYY-MM-DD)
+      from     - start date (YYYY-MM-DD)
+      to       - end date (YYYY-MM-DD)
+      encoding - optional; ``compact`` streams ``{from, to, chunks}`` where each
+                 calendar-year chunk is ``{start, days, encoding, data}`` as
+                 produced by ``encode_heatmap_counts``. Compact ranges may span
+                 up to HEATMAP_COMPACT_MAX_YEARS years.
     """
 
     from_str = request.GET.get("from")
     to_str = request.GET.get("to")
-    start = parse_date(from_str) if from_str else None
-    end = parse_date(to_str) if to_str else None
+    start = parse_date_param(from_str)
+    end = parse_date_param(to_str)
     if not start or not end:
         return Response({"detail": "from and to query params required"}, status=400)
     if end < start:
         return Response({"detail": "to must be after from"}, status=400)
 
-    # enforce a maximum range of 1 year (inclusive)
+    compact = request.GET.get("encoding") == "compact"
     days_span = (end - start).days + 1
-    if days_span > 366:
+    if compact:
+        if days_span > HEATMAP_COMPACT_MAX_YEARS * 366:
+            return Response(
+                {"detail": f"Date range too large (max {HEATMAP_COMPACT_MAX_YEARS} years)"},
+                status=400,
+            )
+    elif days_span > 366:
+        # enforce a maximum range of 1 year (inclusive) for the verbose format
         return Response({"detail": "Date range too large (max 1 year)"}, status=400)
 
     uid = getattr(request.user, "uid", None)
     if not uid:
         return Response({"detail": "Authentication required"}, status=401)
 
-    qs = CheckIn.objects.filter(user_id=uid, date__range=(start, end))
-    aggregated = qs.values("date").annotate(count=Count("id"))
-    counts = {entry["date"]: entry["count"] for entry in aggregated}
+    if compact:
+        return StreamingHttpResponse(
+            _compact_heatmap_chunks(uid, start, end), content_type="application/json"
+        )
+
+    counts = dict(
+        DailyCheckInCount.objects.filter(user_id=uid, date__range=(start, end)).values_list(
+            "date", "count"
+        )
+    )
 
     result = []
     current = start
@@ -188,7 +438,29 @@ def heatmap(request):
     return Response(result)
 
 
+STATS_GRANULARITIES = {
+    "day": TruncDay,
+    "week": TruncWeek,  # ISO weeks, starting on Monday
+    "month": TruncMonth,
+    "quarter": TruncQuarter,
+    "year": TruncYear,
+}
+
+
+def bucket_counts(qs, granularity, measure):
+    """Return ``[(bucket_start, count)]`` for ``qs`` using one GROUP BY query."""
+    rows = (
+        qs.annotate(bucket=STATS_GRANULARITIES[granularity]("date"))
+        .values("bucket")
+        .annotate(total=measure)
+        .order_by("bucket")
+    )
+    return [(row["bucket"], row["total"]) for row in rows]
+
+
 @api_view(["GET"])
+@query_budget(8)
+@conditional_user_data
 def stats(request):
     """Return summary statistics.
 
@@ -196,39 +468,41 @@ def stats(request):
     When omitted, returns global stats across all habits.
 
     Query params:
-      habit_id - optional primary key of the habit
+      habit_id    - optional primary key of the habit
+      granularity - optional bucket size (day, week, month, quarter, year);
+                    returns ``buckets`` instead of ``weekly`` and ``monthly``
+      from, to    - optional date range (YYYY-MM-DD) limiting the buckets
     """
 
     hid = request.GET.get("habit_id")
 
-    def build_buckets(qs):
-        # weekly buckets
-        weekly_qs = (
-            qs.values("date__year", "date__week")
-            .annotate(count=Count("id"))
-            .order_by("date__year", "date__week")
-        )
-        weekly = []
-        for entry in weekly_qs:
-            year = entry["date__year"]
-            week = entry["date__week"]
-            # ISO week start (Monday)
-            week_start = date.fromisocalendar(year, week, 1)
-            weekly.append({"week_start": week_start, "count": entry["count"]})
-
-        # monthly buckets
-        monthly_qs = (
-            qs.values("date__year", "date__month")
-            .annotate(count=Count("id"))
-            .order_by("date__year", "date__month")
-        )
-        monthly = []
-        for entry in monthly_qs:
-            year = entry["date__year"]
-            month = entry["date__month"]
-            month_start = date(year, month, 1)
-            monthly.append({"month_start": month_start, "count": entry["count"]})
+    granularity = request.GET.get("granularity")
+    if granularity and granularity not in STATS_GRANULARITIES:
+        choices = ", ".join(STATS_GRANULARITIES)
+        return Response({"detail": f"granularity must be one of: {choices}"}, status=400)
+
+    from_str = request.GET.get("from")
+    to_str = request.GET.get("to")
+    start = parse_date_param(from_str)
+    end = parse_date_param(to_str)
+    if (from_str and not start) or (to_str and not end):
+        return Response({"detail": "from and to must be dates (YYYY-MM-DD)"}, status=400)
+
+    def build_buckets(qs, measure):
+        if start:
+            qs = qs.filter(date__gte=start)
+        if end:
+            qs = qs.filter(date__lte=end)
+
+        if granularity:
+            buckets = bucket_counts(qs, granularity, measure)
+            return {
+                "granularity": granularity,
+                "buckets": [{"start": b, "count": c} for b, c in buckets],
+            }
 
+        weekly = [{"week_start": b, "count": c} for b, c in bucket_counts(qs, "week", measure)]
+        monthly = [{"month_start": b, "count": c} for b, c in bucket_counts(qs, "month", measure)]
         return {"weekly": weekly, "monthly": monthly}
 
     if hid:
@@ -252,7 +526,7 @@ def stats(request):
         days = (today - start_date).days + 1
         percentage = (total / days * 100) if days > 0 else 0
 
-        buckets = build_buckets(habit.checkins.all())  # type: ignore
+        buckets = build_buckets(habit.checkins.all(), Count("id"))  # type: ignore
 
         return Response(
             {
@@ -271,9 +545,10 @@ def stats(request):
     if not uid:
         return Response({"detail": "Authentication required"}, status=401)
 
-    qs = CheckIn.objects.filter(user_id=uid)
-    total_completed = qs.count()
-    buckets = build_buckets(qs)
+    # one rollup row per active day instead of one row per check-in
+    qs = DailyCheckInCount.objects.filter(user_id=uid)
+    total_completed = qs.aggregate(total=Sum("count"))["total"] or 0
+    buckets = build_buckets(qs, Sum("count"))
 
     return Response(
         {
@@ -286,6 +561,8 @@ def stats(request):
 
 
 @api_view(["GET"])
+@query_budget(5)
+@conditional_user_data
 def xp(request):
     """Return XP summary for the authenticated user.
 
@@ -303,46 +580,66 @@ def xp(request):
 
 
 @api_view(["GET"])
-def leaderboard(request):
-    """Return top users by XP.
+@query_budget(0)
+def export(request):
+    """Stream the authenticated user's habits, check-ins and XP events.
 
     Query params:
-        limit - optional max number of results (default 10, max 50)
+      output - ``ndjson`` (default; one ``{"type": ..., ...}`` object per
+               line) or ``csv`` (one table with a ``type`` column)
     """
-    limit_str = request.GET.get("limit", "10")
-    try:
-        limit = int(limit_str)
-    except ValueError:
-        return Response({"detail": "limit must be an integer"}, status=400)
+    uid = getattr(request.user, "uid", None)
+    if not uid:
+        return Response({"detail": "Authentication required"}, status=401)
 
-    if limit < 1:
-        return Response({"detail": "limit must be >= 1"}, status=400)
-    if limit > 50:
-        limit = 50
+    output = request.GET.get("output", "ndjson")
+    if output not in EXPORT_FORMATS:
+        choices = ", ".join(EXPORT_FORMATS)
+        return Response({"detail": f"output must be one of: {choices}"}, status=400)
+
+    # rows are read while the response is sent, never collected up front
+    if isinstance(request._request, ASGIRequest):
+        rows = aexport_rows(uid, output)
+    else:
+        rows = export_rows(uid, output)
+    response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[output])
+    filename = f"habits-export-{timezone.localdate().isoformat()}.{output}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _snapshot_is_fresh(refreshed_at):
+    """Whether a leaderboard snapshot taken at ``refreshed_at`` may still be served."""
+    if refreshed_at is None:
+        return False
+    return timezone.now() - refreshed_at <= timedelta(seconds=settings.LEADERBOARD_MAX_AGE)
+
+
+def _unnamed_user_ids(entries):
+    return [entry.user_id for _, entry in entries if not entry.display_name and entry.user_id]
+
+
+def _leaderboard_rows(entries, resolved=None):
+    """Serialize ``(position, entry)`` pairs of LeaderboardEntry/UserStats rows.
+
+    ``resolved`` holds cached names of the unnamed users when the caller
+    already looked them up (the async view does so without blocking).
+    """
+    # Names missing from the rows come from the display name cache; unknown
+    # users are resolved in the background so this request makes no Firebase calls.
+    missing = _unnamed_user_ids(entries)
+    if resolved is None:
+        resolved = cached_display_names(missing)
+    unresolved = [uid for uid in missing if uid not in resolved]
+    if unresolved:
+        request_display_names(unresolved)
 
-    top = UserStats.objects.order_by("-xp_total", "user_id")[:limit]
     results = []
-    for entry in top:
+    for position, entry in entries:
         rank_name, _ = get_rank_for_xp(entry.xp_total)
 
-        # Provide a fallback display name: try to use the stored display name,
-        # otherwise fetch their email from Firebase SDK,
-        # and as a last resort fall back to the masked UID string.
-        display = entry.display_name
-        if not display and entry.user_id:
-            try:
-                fb_user = firebase_auth.get_user(entry.user_id)
-                display = fb_user.display_name
-                if not display and fb_user.email:
-                    display = fb_user.email.split("@")[0]
-
-                # Optimistically save it to avoid hitting Firebase again
-                if display:
-                    entry.display_name = display
-                    entry.save(update_fields=["display_name"])
-            except Exception:
-                pass
-
+        # Fall back to the masked UID string when no display name is known yet.
+        display = entry.display_name or resolved.get(entry.user_id)
         if not display:
             display = (
                 f"User {entry.user_id[:6]}..." if entry.user_id else "Unknown User"
@@ -350,11 +647,135 @@ def leaderboard(request):
 
         results.append(
             {
+                "position": position,
                 "user_id": entry.user_id,
                 "display_name": display,
                 "xp_total": entry.xp_total,
                 "rank": rank_name,
             }
         )
+    return results
+
+
+@require_GET
+@query_budget(3)
+async def leaderboard(request):
+    """Return users ranked by XP, one page at a time.
+
+    Pages come from the LeaderboardEntry snapshot (see ``refresh_leaderboard``);
+    when there is none, or it is older than ``LEADERBOARD_MAX_AGE``, the
+    ranking is computed from UserStats directly.
+    Async so that serving it under ASGI never ties up a worker thread.
+
+    Query params:
+        limit  - optional page size (default 10, max 50)
+        cursor - optional ``next_cursor`` of the previous page
+    """
+    limit_str = request.GET.get("limit", "10")
+    cursor_str = request.GET.get("cursor", "0")
+    try:
+        limit = int(limit_str)
+    except ValueError:
+        return JsonResponse({"detail": "limit must be an integer"}, status=400)
+    try:
+        cursor = int(cursor_str)
+    except ValueError:
+        return JsonResponse({"detail": "cursor must be an integer"}, status=400)
 
-    return Response({"count": len(results), "results": results})
+    if limit < 1:
+        return JsonResponse({"detail": "limit must be >= 1"}, status=400)
+    if cursor < 0:
+        return JsonResponse({"detail": "cursor must be >= 0"}, status=400)
+    if limit > 50:
+        limit = 50
+
+    # the cursor is the position of the last row already returned
+    page = [entry async for entry in LeaderboardEntry.objects.filter(rank__gt=cursor)[: limit + 1]]
+    if page:
+        refreshed_at = page[0].refreshed_at
+    else:
+        refreshed_at = await LeaderboardEntry.objects.values_list("refreshed_at", flat=True).afirst()
+    if _snapshot_is_fresh(refreshed_at):
+        entries = [(entry.rank, entry) for entry in page]
+    else:
+        refreshed_at = None
+        live = UserStats.objects.order_by("-xp_total", "user_id")[cursor : cursor + limit + 1]
+        entries = list(enumerate([stats async for stats in live], start=cursor + 1))
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    resolved = await acached_display_names(_unnamed_user_ids(entries))
+    results = _leaderboard_rows(entries, resolved)
+    return JsonResponse(
+        {
+            "count": len(results),
+            "results": results,
+            "next_cursor": results[-1]["position"] if has_more else None,
+            "refreshed_at": refreshed_at,
+        }
+    )
+
+
+@api_view(["GET"])
+@query_budget(6)
+def leaderboard_me(request):
+    """Return the authenticated user's leaderboard position and neighbors.
+
+    Users who joined after the last snapshot get an estimated position. As in
+    ``leaderboard``, a missing or stale snapshot is replaced by a live ranking.
+
+    Query params:
+        neighbors - optional number of rows above and below (default 2, max 10)
+    """
+    uid = getattr(request.user, "uid", None)
+    if not uid:
+        return Response({"detail": "Authentication required"}, status=401)
+
+    try:
+        neighbors = min(int(request.GET.get("neighbors", "2")), 10)
+    except ValueError:
+        return Response({"detail": "neighbors must be an integer"}, status=400)
+    if neighbors < 0:
+        return Response({"detail": "neighbors must be >= 0"}, status=400)
+
+    entry = LeaderboardEntry.objects.filter(user_id=uid).first()
+    if entry is not None:
+        refreshed_at = entry.refreshed_at
+    else:
+        refreshed_at = LeaderboardEntry.objects.values_list("refreshed_at", flat=True).first()
+
+    if _snapshot_is_fresh(refreshed_at):
+        if entry is not None:
+            position, xp_total, estimated = entry.rank, entry.xp_total, False
+        else:
+            xp_total = UserStats.objects.filter(user_id=uid).values_list("xp_total", flat=True).first() or 0
+            position, estimated = LeaderboardEntry.estimate_rank(xp_total), True
+        around = [
+            (e.rank, e)
+            for e in LeaderboardEntry.objects.filter(
+                rank__gte=position - neighbors, rank__lte=position + neighbors
+            )
+        ]
+    else:
+        stored = UserStats.objects.filter(user_id=uid).values_list("xp_total", flat=True).first()
+        xp_total, estimated = stored or 0, stored is None
+        # same order as the snapshot: XP descending, ties by user id
+        position = 1 + UserStats.objects.filter(
+            Q(xp_total__gt=xp_total) | Q(xp_total=xp_total, user_id__lt=uid)
+        ).count()
+        first = max(position - neighbors, 1)
+        live = UserStats.objects.order_by("-xp_total", "user_id")[first - 1 : position + neighbors]
+        around = list(enumerate(live, start=first))
+
+    rank_name, xp_to_next = get_rank_for_xp(xp_total)
+    return Response(
+        {
+            "user_id": uid,
+            "position": position,
+            "estimated": estimated,
+            "xp_total": xp_total,
+            "rank": rank_name,
+            "next_rank_xp": xp_to_next,
+            "neighbors": _leaderboard_rows(around),
+        }
+    )
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class HabitsConfig(AppConfig):
     name = 'habits'
+
+    def ready(self):
+        # connects the query recorder before any database connection is opened
+        from .api import query_budget  # noqa: F401
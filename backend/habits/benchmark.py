@@ -0,0 +1,241 @@
+"""
+Benchmarks - time the main API endpoints against synthetic data of several
+sizes and report latency percentiles and query counts
+Requests go through the full middleware and authentication stack; Firebase
+is replaced by a local token issuer and the blockchain RPC by a stub that is
+always unavailable, so a run needs no network access
+"""
+import json
+import math
+import random
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import rpc_client, synthetic_data
+from .models import Habit
+
+# (users, habits per user, years of history)
+DEFAULT_SIZES = [(50, 3, 1), (200, 5, 2), (500, 5, 3)]
+DEFAULT_ITERATIONS = 50
+WARMUP_ITERATIONS = 3
+
+
+class LocalTokenIssuer:
+    """Signs Firebase-style ID tokens with a throwaway key the backend trusts"""
+
+    KID = "benchmark"
+    PROJECT_ID = "benchmark-project"
+
+    def __init__(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.public_pem = (
+            self.private_key.public_key()
+            .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            .decode()
+        )
+        self._tokens = {}
+
+    def token(self, uid: str) -> str:
+        import jwt
+
+        if uid not in self._tokens:
+            now = int(time.time())
+            claims = {
+                "iss": f"https://securetoken.google.com/{self.PROJECT_ID}",
+                "aud": self.PROJECT_ID,
+                "sub": uid,
+                "iat": now,
+                "exp": now + 3600,
+            }
+            self._tokens[uid] = jwt.encode(
+                claims, self.private_key, algorithm="RS256", headers={"kid": self.KID}
+            )
+        return self._tokens[uid]
+
+    @contextmanager
+    def installed(self):
+        """Make config.firebase_auth verify tokens from this issuer only"""
+        from config import firebase_auth
+
+        firebase_auth.signing_keys.set_local_keys({self.KID: self.public_pem})
+        firebase_auth.token_cache.clear()
+        try:
+            with mock.patch.object(firebase_auth, "PROJECT_ID", self.PROJECT_ID):
+                yield self
+        finally:
+            firebase_auth.signing_keys.reset()
+            firebase_auth.token_cache.clear()
+
+
+class UnavailableRpcClient:
+    """Stands in for the RPC clients: every call fails fast as if all nodes were down"""
+
+    available = False
+
+    def call(self, fn):
+        raise rpc_client.RpcUnavailable("RPC is stubbed out in benchmarks")
+
+
+@contextmanager
+def stubbed_services(issuer: LocalTokenIssuer):
+    from . import display_names, subscription_service
+
+    stub = UnavailableRpcClient()
+    with issuer.installed(), mock.patch.object(rpc_client, "_client", stub), mock.patch.object(
+        rpc_client, "_async_client", stub
+    ), mock.patch.object(subscription_service, "_service", None), mock.patch.object(
+        display_names, "_ensure_worker"
+    ):
+        yield
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(durations, query_counts) -> dict:
+    ms = sorted(d * 1000 for d in durations)
+    return {
+        "iterations": len(ms),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p90_ms": round(percentile(ms, 90), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3) if ms else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "queries": {
+            "min": min(query_counts, default=0),
+            "max": max(query_counts, default=0),
+        },
+    }
+
+
+def endpoint_requests(today):
+    """``{name: make_request(client, uid, iteration)}`` for every benchmarked endpoint"""
+    year_ago = (today - timedelta(days=364)).isoformat()
+    habits_by_user = {}
+
+    def habit_for(uid):
+        if uid not in habits_by_user:
+            habits_by_user[uid] = Habit.objects.filter(user_id=uid).values_list("pk", flat=True).first()
+        return habits_by_user[uid]
+
+    def checkin_post(client, uid, i):
+        # dates before any synthetic history, never taken twice
+        day = today - timedelta(days=365 * 20 + i)
+        return client.post(
+            "/api/checkins/",
+            {"habit": habit_for(uid), "date": day.isoformat()},
+            content_type="application/json",
+        )
+
+    return {
+        "heatmap": lambda c, uid, i: c.get("/api/heatmap/", {"from": year_ago, "to": today.isoformat()}),
+        "heatmap_compact": lambda c, uid, i: c.get(
+            "/api/heatmap/",
+            {"from": (today - timedelta(days=365 * 5)).isoformat(), "to": today.isoformat(), "encoding": "compact"},
+        ),
+        "stats": lambda c, uid, i: c.get("/api/stats/"),
+        "habits": lambda c, uid, i: c.get("/api/habits/"),
+        "checkins": lambda c, uid, i: c.get("/api/checkins/"),
+        "checkin_post": checkin_post,
+        "leaderboard": lambda c, uid, i: c.get("/api/leaderboard/"),
+    }
+
+
+def time_endpoint(make_request, issuer: LocalTokenIssuer, user_ids, iterations: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    durations, query_counts = [], []
+    for i in range(-WARMUP_ITERATIONS, iterations):
+        uid = rng.choice(user_ids)
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {issuer.token(uid)}")
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = make_request(client, uid, i + WARMUP_ITERATIONS)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.status_code} from benchmark request: {response.content[:200]!r}")
+        if i >= 0:
+            durations.append(elapsed)
+            query_counts.append(len(queries))
+    return summarize(durations, query_counts)
+
+
+def run(sizes=DEFAULT_SIZES, iterations: int = DEFAULT_ITERATIONS, seed: int = 0, only=None, log=None) -> dict:
+    """
+    Benchmark every endpoint at each ``(users, habits, years)`` size
+    Synthetic users are regenerated per size, so run this against a
+    disposable database
+    """
+    issuer = LocalTokenIssuer()
+    today = timezone.localdate()
+
+    report = {
+        "created_at": timezone.now().isoformat(),
+        "commit": current_commit(),
+        "database": connection.vendor,
+        "iterations": iterations,
+        "sizes": [],
+    }
+    with stubbed_services(issuer):
+        for users, habits, years in sizes:
+            synthetic_data.clear()
+            started = time.perf_counter()
+            # the benchmark runs on a throwaway test database
+            counts = synthetic_data.generate(users, habits, years, seed=seed, end=today, refresh_leaderboard=True)
+            if log:
+                log(
+                    f"{users} users x {habits} habits x {years} years: {counts['checkins']} check-ins "
+                    f"generated in {time.perf_counter() - started:.1f}s"
+                )
+            user_ids = synthetic_data.synthetic_user_ids()
+            requests = endpoint_requests(today)
+            if only:
+                requests = {name: fn for name, fn in requests.items() if name in only}
+
+            endpoints = {}
+            for name, make_request in requests.items():
+                endpoints[name] = time_endpoint(make_request, issuer, user_ids, iterations, seed)
+                if log:
+                    result = endpoints[name]
+                    log(
+                        f"  {name:<16} p50 {result['p50_ms']:>8.2f} ms  p90 {result['p90_ms']:>8.2f} ms  "
+                        f"p99 {result['p99_ms']:>8.2f} ms  queries {result['queries']['max']}"
+                    )
+            report["sizes"].append(
+                {"users": users, "habits_per_user": habits, "years": years, **counts, "endpoints": endpoints}
+            )
+        synthetic_data.clear()
+    return report
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def write_report(report: dict, path: str) -> None:
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2)
+        fh.write("\n")
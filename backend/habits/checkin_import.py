@@ -0,0 +1,182 @@
+"""
+Check-in import - history from a CSV file, e.g. another tracker's export
+The file is parsed and validated first; check-ins are then inserted in large
+batches with duplicates skipped, and streaks, daily counts and XP are brought
+up to date once at the end, in the same transaction
+Accepted layouts (header names are case-insensitive):
+  habit,date[,color,description]  - one row per check-in, habits by name
+  the CSV from /api/export/       - habit rows first, check-ins by habit_id
+"""
+import codecs
+import csv
+from typing import Iterable, Iterator, Tuple
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .checkin_service import BULK_BATCH_SIZE, apply_new_checkins
+from .models import CheckIn, Habit, UserStats
+
+# Check-ins collected before each INSERT round
+IMPORT_BATCH_SIZE = 5000
+# Refuse files beyond this many data rows
+MAX_IMPORT_ROWS = 500_000
+
+_HABIT_NAME_MAX = Habit._meta.get_field("name").max_length
+_COLOR_MAX = Habit._meta.get_field("color").max_length
+
+
+class CheckInImportError(ValueError):
+    pass
+
+
+def decode_lines(source, encoding: str = "utf-8-sig") -> Iterator[str]:
+    """Text lines of a binary file-like/iterable (uploads, request bodies, files)"""
+    return codecs.iterdecode(source, encoding)
+
+
+def parse_rows(lines: Iterable[str]) -> Iterator[Tuple[str, object, dict]]:
+    """Yield ``(habit name, date, habit attributes)`` for each check-in row"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise CheckInImportError("The file is empty")
+    columns = {name.strip().lower(): i for i, name in enumerate(header)}
+
+    def value(row, name):
+        i = columns.get(name)
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    exported = "type" in columns and "habit_id" in columns
+    if not exported and not {"habit", "date"} <= columns.keys():
+        raise CheckInImportError("Expected a header with 'habit' and 'date' columns")
+
+    # habit id -> (name, attributes), for the /api/export/ layout
+    exported_habits = {}
+    for row in reader:
+        if reader.line_num > MAX_IMPORT_ROWS + 1:
+            raise CheckInImportError(f"Too many rows (max {MAX_IMPORT_ROWS})")
+        if not any(cell.strip() for cell in row):
+            continue
+
+        if exported:
+            kind = value(row, "type")
+            if kind == "habit":
+                exported_habits[value(row, "id")] = (
+                    value(row, "name"),
+                    {"color": value(row, "color"), "description": value(row, "description")},
+                )
+                continue
+            if kind != "checkin":
+                # XP is recomputed, not imported
+                continue
+            habit = exported_habits.get(value(row, "habit_id"))
+            if habit is None:
+                raise CheckInImportError(f"Line {reader.line_num}: unknown habit_id {value(row, 'habit_id')!r}")
+            name, attrs = habit
+        else:
+            name = value(row, "habit")
+            attrs = {"color": value(row, "color"), "description": value(row, "description")}
+
+        if not name:
+            raise CheckInImportError(f"Line {reader.line_num}: habit name is missing")
+        if len(name) > _HABIT_NAME_MAX:
+            raise CheckInImportError(f"Line {reader.line_num}: habit name is longer than {_HABIT_NAME_MAX}")
+        raw_date = value(row, "date")
+        try:
+            day = parse_date(raw_date[:10])
+        except ValueError:
+            day = None
+        if day is None:
+            raise CheckInImportError(f"Line {reader.line_num}: invalid date {raw_date!r} (expected YYYY-MM-DD)")
+        yield name, day, attrs
+
+
+def read_checkins(lines: Iterable[str]) -> Tuple[int, dict, set]:
+    """
+    Parse and validate the whole file up front
+    Returns (row count, {habit name: attributes} in first-seen order,
+    set of (habit name, date))
+    """
+    rows = 0
+    habit_attrs = {}
+    checkins = set()
+    for name, day, attrs in parse_rows(lines):
+        rows += 1
+        habit_attrs.setdefault(name, attrs)
+        checkins.add((name, day))
+    return rows, habit_attrs, checkins
+
+
+def _insert_new(user_id: str, batch: set) -> list:
+    """Insert the (habit_id, date) pairs of ``batch`` not stored yet; returns them"""
+    existing = set(
+        CheckIn.objects.filter(
+            habit_id__in={habit_id for habit_id, _ in batch}, date__in={d for _, d in batch}
+        )
+        .order_by()
+        .values_list("habit_id", "date")
+    )
+    new_entries = sorted(batch - existing)
+    CheckIn.objects.bulk_create(
+        [CheckIn(user_id=user_id, habit_id=habit_id, date=d) for habit_id, d in new_entries],
+        batch_size=BULK_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return new_entries
+
+
+def import_checkins(user_id: str, lines: Iterable[str], display_name: str = "") -> dict:
+    """
+    Import check-ins from CSV ``lines`` for ``user_id``, all or nothing
+    The file is read completely before the transaction starts, so a slow
+    upload never holds a connection or locks. Habits are matched by name and
+    created when missing, within the free tier limit unless the user is premium
+    Raises CheckInImportError for malformed files or too many habits
+    Returns {rows, habits_created, created, skipped, xp_awarded}
+    """
+    from .subscription_service import FREE_TIER_LIMIT, get_subscription_service, invalidate_entitlement
+
+    rows, habit_attrs, checkins = read_checkins(lines)
+
+    with transaction.atomic():
+        habits = {h.name: h for h in Habit.objects.select_for_update().filter(user_id=user_id)}
+        missing = [name for name in habit_attrs if name not in habits]
+        if missing and len(habits) + len(missing) > FREE_TIER_LIMIT:
+            entitlement = get_subscription_service().get_entitlement(user_id, fresh=True)
+            if not entitlement["subscription"]["is_active"]:
+                name = missing[max(FREE_TIER_LIMIT - len(habits), 0)]
+                raise CheckInImportError(
+                    f"Importing {name!r} would exceed the free tier limit of {FREE_TIER_LIMIT} habits. "
+                    "Upgrade to premium to import more."
+                )
+        for name in missing:
+            attrs = habit_attrs[name]
+            habit = Habit(user_id=user_id, name=name, description=attrs.get("description", ""))
+            if attrs.get("color"):
+                habit.color = attrs["color"][:_COLOR_MAX]
+            habit.save()
+            habits[name] = habit
+
+        entries = sorted((habits[name].pk, day) for name, day in checkins)
+        new_entries = []
+        for i in range(0, len(entries), IMPORT_BATCH_SIZE):
+            new_entries += _insert_new(user_id, set(entries[i : i + IMPORT_BATCH_SIZE]))
+
+        xp_awarded = 0
+        if new_entries:
+            touched = {habit_id for habit_id, _ in new_entries}
+            xp_awarded = apply_new_checkins(
+                user_id, [h for h in habits.values() if h.pk in touched], new_entries, display_name
+            )
+        if missing:
+            UserStats.bump_data_version(user_id)
+            transaction.on_commit(lambda: invalidate_entitlement(user_id))
+
+    return {
+        "rows": rows,
+        "habits_created": len(missing),
+        "created": len(new_entries),
+        "skipped": rows - len(new_entries),
+        "xp_awarded": xp_awarded,
+    }
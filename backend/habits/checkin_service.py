@@ -0,0 +1,210 @@
+"""
+Check-in service - records the state derived from check-ins
+(streaks, daily counts, XP) atomically alongside the check-in itself
+"""
+from datetime import timedelta
+from typing import Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    CheckIn,
+    DailyCheckInCount,
+    Habit,
+    UserStats,
+    XpEvent,
+    checkin_dates_by_habit,
+    summarize_runs,
+)
+
+# XP awarded once per habit/day, plus a bonus when the run of consecutive days
+# ending on that day hits a milestone - the same for single, bulk and imported
+# check-ins, whatever day they are recorded on
+BASE_XP = 10
+STREAK_MILESTONE_BONUS = {
+    5: 20,
+    10: 40,
+    20: 80,
+    50: 200,
+    100: 500,
+    150: 800,
+    200: 1000,
+}
+
+# Rows per INSERT statement for bulk check-in/XP inserts
+BULK_BATCH_SIZE = 500
+
+
+def xp_for_streak(streak: int) -> int:
+    return BASE_XP + STREAK_MILESTONE_BONUS.get(streak, 0)
+
+
+def award_xp(user_id: str, amount: int, display_name: str = "") -> None:
+    """
+    Add ``amount`` XP (may be 0) and bump the user's data version with a
+    single UPDATE, so concurrent awards never overwrite each other
+    """
+    changes = {
+        "xp_total": F("xp_total") + amount,
+        "data_version": F("data_version") + 1,
+        "updated_at": timezone.now(),
+    }
+    if display_name:
+        changes["display_name"] = display_name
+
+    rows = UserStats.objects.filter(user_id=user_id)
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            UserStats.objects.create(
+                user_id=user_id, xp_total=amount, data_version=1, display_name=display_name
+            )
+    except IntegrityError:
+        # created concurrently by another request
+        rows.update(**changes)
+
+
+def _create_xp_event(user_id: str, habit: Habit, day) -> bool:
+    """Insert the XP event for habit/day; False if it was already awarded"""
+    try:
+        with transaction.atomic():
+            XpEvent.objects.create(user_id=user_id, habit=habit, date=day)
+    except IntegrityError:
+        return False
+    return True
+
+
+def record_checkin(checkin, display_name: str = "") -> int:
+    """
+    Update streaks, daily counts and XP for a newly saved check-in
+    Must run in the transaction that created the check-in; returns XP awarded
+    """
+    # serialize writers per habit so the incremental streak update sees fresh state
+    habit = Habit.objects.select_for_update().get(pk=checkin.habit_id)
+    checkin.habit = habit
+    habit.record_checkin_added(checkin.date)
+    DailyCheckInCount.adjust(checkin.user_id, checkin.date, 1)
+
+    amount = 0
+    if _create_xp_event(checkin.user_id, habit, checkin.date):
+        amount = xp_for_streak(_run_length_ending(habit, checkin.date))
+    award_xp(checkin.user_id, amount, display_name)
+    return amount
+
+
+def remove_checkin(checkin) -> None:
+    """Delete a check-in and roll back its streak and daily count contribution"""
+    with transaction.atomic():
+        habit = Habit.objects.select_for_update().get(pk=checkin.habit_id)
+        checkin.delete()
+        habit.record_checkin_removed(checkin.date)
+        DailyCheckInCount.adjust(checkin.user_id, checkin.date, -1)
+        UserStats.bump_data_version(checkin.user_id)
+
+
+def _run_length_ending(habit: Habit, day) -> int:
+    """Length of the habit's run of consecutive check-in days ending on ``day``"""
+    if day == habit.last_checkin_date:
+        return habit.current_run_length()
+    # back-filled day: walk back from it until the first gap
+    length = 0
+    expected = day
+    dates = habit.checkins.filter(date__lte=day).order_by("-date").values_list("date", flat=True)
+    for d in dates.iterator(chunk_size=100):
+        if d != expected:
+            break
+        length += 1
+        expected = d - timedelta(days=1)
+    return length
+
+
+def _run_lengths(dates) -> dict:
+    """Map each of the ascending ``dates`` to the length of the run ending on it"""
+    lengths = {}
+    prev = None
+    for d in dates:
+        lengths[d] = lengths[prev] + 1 if prev is not None and d == prev + timedelta(days=1) else 1
+        prev = d
+    return lengths
+
+
+def apply_new_checkins(user_id: str, habits, new_entries, display_name: str = "") -> int:
+    """
+    Bring streaks, daily counts and XP up to date after the (habit_id, date)
+    pairs in ``new_entries`` were bulk inserted for ``habits``
+    XP is awarded as if each check-in had been made on its own day
+    Returns the XP awarded
+    """
+    dates = {d for _, d in new_entries}
+    DailyCheckInCount.rebuild(user_id=user_id, dates=dates)
+
+    dates_by_habit = checkin_dates_by_habit(habits)
+    for habit in habits:
+        habit.current_run_start, habit.last_checkin_date, habit.longest_run = summarize_runs(
+            dates_by_habit.get(habit.pk, ())
+        )
+    Habit.objects.bulk_update(habits, Habit.STREAK_FIELDS)
+
+    awarded = set(
+        XpEvent.objects.filter(user_id=user_id, habit__in=habits, date__in=dates).values_list(
+            "habit_id", "date"
+        )
+    )
+    to_award = [entry for entry in new_entries if entry not in awarded]
+    XpEvent.objects.bulk_create(
+        [XpEvent(user_id=user_id, habit_id=habit_id, date=d) for habit_id, d in to_award],
+        batch_size=BULK_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    run_lengths = {}
+    amount = 0
+    for habit_id, d in to_award:
+        if habit_id not in run_lengths:
+            run_lengths[habit_id] = _run_lengths(dates_by_habit[habit_id])
+        amount += xp_for_streak(run_lengths[habit_id][d])
+    award_xp(user_id, amount, display_name)
+    return amount
+
+
+def record_checkins(user_id: str, entries, display_name: str = "") -> Tuple[int, int]:
+    """
+    Insert many (habit_id, date) check-ins for one user in a single transaction
+    Existing check-ins are skipped and derived state is updated once per batch
+    Raises ValueError if any habit does not belong to the user
+    Returns (created, xp_awarded)
+    """
+    entries = set(entries)
+    if not entries:
+        return 0, 0
+    habit_ids = {habit_id for habit_id, _ in entries}
+
+    with transaction.atomic():
+        habits = {
+            h.pk: h
+            for h in Habit.objects.select_for_update().filter(user_id=user_id, pk__in=habit_ids)
+        }
+        unknown = habit_ids - habits.keys()
+        if unknown:
+            raise ValueError(f"Unknown habits: {', '.join(map(str, sorted(unknown)))}")
+
+        existing = set(
+            CheckIn.objects.filter(habit_id__in=habit_ids, date__in={d for _, d in entries})
+            .order_by()
+            .values_list("habit_id", "date")
+        )
+        new_entries = sorted(entries - existing)
+        if not new_entries:
+            return 0, 0
+
+        CheckIn.objects.bulk_create(
+            [CheckIn(user_id=user_id, habit_id=habit_id, date=d) for habit_id, d in new_entries],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        touched = [habits[habit_id] for habit_id in sorted({h for h, _ in new_entries})]
+        xp_awarded = apply_new_checkins(user_id, touched, new_entries, display_name)
+    return len(new_entries), xp_awarded
@@ -0,0 +1,126 @@
+"""
+Display name resolution for the leaderboard.
+
+Users without a stored display name are looked up in Firebase in the
+background, in batches via ``auth.get_users``. Results (including users with
+no usable name) are cached so request handlers never call Firebase.
+"""
+import logging
+import threading
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from firebase_admin import auth as firebase_auth
+
+from config.metrics import external_call
+
+from .models import UserStats
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "display_name:"
+# Resolved names are also written to UserStats, the cache only avoids re-reads
+CACHE_TTL = 24 * 60 * 60
+# Users without a name in Firebase are not looked up again for this long
+NEGATIVE_CACHE_TTL = 60 * 60
+# Short back-off after a failed Firebase call
+ERROR_CACHE_TTL = 5 * 60
+# Maximum number of identifiers accepted by auth.get_users
+BATCH_SIZE = 100
+
+_pending = set()
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+
+
+def _name_from_record(record) -> str:
+    if record.display_name:
+        return record.display_name
+    if record.email and "@" in record.email:
+        return record.email.split("@")[0]
+    return ""
+
+
+def cached_display_names(user_ids) -> dict:
+    """Return ``{uid: name}`` for already-resolved users.
+
+    An empty name means the user is known to have no display name.
+    """
+    keys = {f"{CACHE_PREFIX}{uid}": uid for uid in user_ids}
+    return {keys[key]: name for key, name in cache.get_many(list(keys)).items()}
+
+
+async def acached_display_names(user_ids) -> dict:
+    """Async ``cached_display_names``."""
+    keys = {f"{CACHE_PREFIX}{uid}": uid for uid in user_ids}
+    return {keys[key]: name for key, name in (await cache.aget_many(list(keys))).items()}
+
+
+def resolve_display_names(user_ids) -> dict:
+    """Look ``user_ids`` up in Firebase, cache the results and store found names."""
+    resolved = {}
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), BATCH_SIZE):
+        chunk = user_ids[i : i + BATCH_SIZE]
+        try:
+            with external_call("firebase"):
+                result = firebase_auth.get_users([firebase_auth.UidIdentifier(uid) for uid in chunk])
+        except Exception as e:
+            logger.warning(f"Error resolving display names for {len(chunk)} users: {e}")
+            cache.set_many({f"{CACHE_PREFIX}{uid}": "" for uid in chunk}, ERROR_CACHE_TTL)
+            continue
+
+        names = {uid: "" for uid in chunk}
+        for record in result.users:
+            names[record.uid] = _name_from_record(record)
+        found = {uid: name for uid, name in names.items() if name}
+        cache.set_many({f"{CACHE_PREFIX}{uid}": name for uid, name in found.items()}, CACHE_TTL)
+        cache.set_many(
+            {f"{CACHE_PREFIX}{uid}": "" for uid, name in names.items() if not name},
+            NEGATIVE_CACHE_TTL,
+        )
+        resolved.update(names)
+
+        stats = list(UserStats.objects.filter(user_id__in=found, display_name=""))
+        for entry in stats:
+            entry.display_name = found[entry.user_id]
+        UserStats.objects.bulk_update(stats, ["display_name"])
+    return resolved
+
+
+def request_display_names(user_ids):
+    """Queue ``user_ids`` for background resolution."""
+    with _lock:
+        _pending.update(user_ids)
+    _ensure_worker()
+    _wakeup.set()
+
+
+def flush():
+    """Resolve every queued user id in the calling thread."""
+    with _lock:
+        user_ids = list(_pending)
+        _pending.clear()
+    if user_ids:
+        resolve_display_names(user_ids)
+
+
+def _run():
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Display name worker failed: {e}")
+        finally:
+            close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="display-names", daemon=True)
+            _worker.start()
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from habits import benchmark
+
+
+def parse_sizes(value: str):
+    """``"50x3x1,200x5x2"`` -> ``[(50, 3, 1.0), (200, 5, 2.0)]`` (users x habits x years)"""
+    sizes = []
+    for part in value.split(","):
+        try:
+            users, habits, years = part.strip().split("x")
+            sizes.append((int(users), int(habits), float(years)))
+        except ValueError:
+            raise CommandError(f"Invalid size {part!r}, expected USERSxHABITSxYEARS")
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints on synthetic data and write latency percentiles and "
+        "query counts to a JSON file. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default=",".join(f"{u}x{h}x{y}" for u, h, y in benchmark.DEFAULT_SIZES),
+            help="Comma-separated USERSxHABITSxYEARS data sizes",
+        )
+        parser.add_argument("--iterations", type=int, default=benchmark.DEFAULT_ITERATIONS)
+        parser.add_argument("--endpoint", action="append", dest="endpoints", help="Only benchmark these (repeatable)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark-results.json")
+
+    def handle(self, *args, **options):
+        sizes = parse_sizes(options["sizes"])
+        old_name = connection.settings_dict["NAME"]
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = benchmark.run(
+                sizes,
+                iterations=options["iterations"],
+                seed=options["seed"],
+                only=options["endpoints"],
+                log=self.stdout.write,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        benchmark.write_report(report, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
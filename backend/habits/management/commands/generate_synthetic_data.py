@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from habits import synthetic_data
+
+
+class Command(BaseCommand):
+    help = "Create synthetic users with habits and years of check-in history (for load tests and benchmarks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--habits", type=int, default=5, help="Habits per user")
+        parser.add_argument("--years", type=float, default=2)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default=synthetic_data.DEFAULT_PREFIX, help="User id prefix")
+        parser.add_argument("--clear", action="store_true", help="Remove existing synthetic users first")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            synthetic_data.clear(options["prefix"])
+        counts = synthetic_data.generate(
+            options["users"], options["habits"], options["years"], seed=options["seed"], prefix=options["prefix"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {counts['users']} users, {counts['habits']} habits, {counts['checkins']} check-ins"
+            )
+        )
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.checkin_import import CheckInImportError, decode_lines, import_checkins
+
+
+class Command(BaseCommand):
+    help = "Import a user's check-in history from a CSV file (habit,date or an /api/export/ CSV)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", help="Firebase UID of the owner")
+        parser.add_argument("path", help="CSV file, or - for stdin")
+
+    def handle(self, *args, **options):
+        try:
+            if options["path"] == "-":
+                result = import_checkins(options["user_id"], decode_lines(sys.stdin.buffer))
+            else:
+                with open(options["path"], "rb") as fh:
+                    result = import_checkins(options["user_id"], decode_lines(fh))
+        except OSError as e:
+            raise CommandError(str(e))
+        except (CheckInImportError, UnicodeDecodeError) as e:
+            raise CommandError(f"Nothing imported: {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['created']} check-ins ({result['skipped']} skipped), "
+                f"created {result['habits_created']} habits, awarded {result['xp_awarded']} XP"
+            )
+        )
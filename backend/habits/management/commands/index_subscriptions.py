@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from habits.rpc_client import RpcUnavailable, get_rpc_client
+from habits.subscription_indexer import sync
+from habits.subscription_service import CONTRACT_ADDRESS
+
+
+class Command(BaseCommand):
+    help = "Index SubscriptionPurchased events from the subscription contract (once, or polling)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contract", default=CONTRACT_ADDRESS)
+        parser.add_argument("--to-block", type=int, default=None)
+        parser.add_argument(
+            "--poll", type=float, default=0, help="Seconds between syncs; 0 syncs once and exits"
+        )
+
+    def handle(self, *args, **options):
+        contract = options["contract"]
+        if not contract:
+            raise CommandError("Set SUBSCRIPTION_CONTRACT_ADDRESS or pass --contract")
+        rpc = get_rpc_client()
+
+        while True:
+            try:
+                start, end, payments = sync(rpc, contract, to_block=options["to_block"])
+                if end >= start:
+                    self.stdout.write(f"Indexed blocks {start}-{end}: {payments} payments")
+            except RpcUnavailable as e:
+                if not options["poll"]:
+                    raise CommandError(str(e))
+                self.stderr.write(f"RPC unavailable, retrying: {e}")
+            finally:
+                close_old_connections()
+
+            if not options["poll"]:
+                break
+            time.sleep(options["poll"])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from habits.models import DailyCheckInCount
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user daily check-in counts from the CheckIn table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", dest="user_id", help="Only rebuild this Firebase UID")
+
+    def handle(self, *args, **options):
+        created = DailyCheckInCount.rebuild(user_id=options["user_id"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily count rows"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from habits.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ranked leaderboard snapshot from UserStats (run periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        total = LeaderboardEntry.refresh(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Ranked {total} users"))
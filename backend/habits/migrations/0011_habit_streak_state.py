@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_alter_subscription_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='current_run_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_checkin_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_run',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
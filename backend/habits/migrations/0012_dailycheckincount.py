@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_daily_counts(apps, schema_editor):
+    CheckIn = apps.get_model('habits', 'CheckIn')
+    DailyCheckInCount = apps.get_model('habits', 'DailyCheckInCount')
+    rows = CheckIn.objects.values('user_id', 'date').annotate(total=Count('id')).order_by()
+    DailyCheckInCount.objects.bulk_create(
+        [DailyCheckInCount(user_id=r['user_id'], date=r['date'], count=r['total']) for r in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0011_habit_streak_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCheckInCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=128)),
+                ('date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'date'), name='uniq_daily_checkin_count')],
+            },
+        ),
+        migrations.RunPython(populate_daily_counts, migrations.RunPython.noop),
+    ]
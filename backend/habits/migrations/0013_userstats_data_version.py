@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_dailycheckincount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-17 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0013_userstats_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('user_id', models.CharField(max_length=128, unique=True)),
+                ('display_name', models.CharField(blank=True, default='', max_length=255)),
+                ('xp_total', models.IntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['rank'],
+                'indexes': [models.Index(models.OrderBy(models.F('xp_total'), descending=True), models.F('rank'), name='leaderboard_xp_rank_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0014_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubscriptionPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(db_index=True, max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField(db_index=True)),
+                ('buyer', models.CharField(db_index=True, max_length=42)),
+                ('amount_wei', models.DecimalField(decimal_places=0, max_digits=78)),
+                ('paid_at', models.DateTimeField()),
+                ('indexed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='uniq_subscription_payment_log')],
+            },
+        ),
+    ]
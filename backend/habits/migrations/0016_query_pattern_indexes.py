@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0015_subscription_payment_indexer'),
+    ]
+
+    operations = [
+        # create the composite indexes before dropping the single-column ones
+        migrations.AddIndex(
+            model_name='checkin',
+            index=models.Index(fields=['user_id', '-date', '-id'], name='checkin_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(models.OrderBy(models.F('xp_total'), descending=True), models.F('user_id'), name='userstats_xp_user_idx'),
+        ),
+        migrations.AlterField(
+            model_name='checkin',
+            name='user_id',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='xpevent',
+            name='user_id',
+            field=models.CharField(max_length=128),
+        ),
+    ]
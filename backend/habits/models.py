@@ -1,8 +1,30 @@
-from django.db import models
+from collections import defaultdict
+from itertools import islice
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
 from datetime import timedelta
 from django.utils import timezone
 
 
+def summarize_runs(dates):
+    """Return (current_run_start, last_date, longest_run) for ascending dates.
+
+    ``dates`` must be sorted ascending; duplicates are ignored. The "current
+    run" is the run of consecutive days ending at the most recent date.
+    """
+    run_start = None
+    prev = None
+    longest = 0
+    for d in dates:
+        if d == prev:
+            continue
+        if prev is None or d != prev + timedelta(days=1):
+            run_start = d
+        prev = d
+        longest = max(longest, (d - run_start).days + 1)
+    return run_start, prev, longest
+
+
 class Habit(models.Model):
     # Firebase UID of the owning user
     user_id = models.CharField(max_length=128, db_index=True, blank=True, default="")
@@ -11,39 +33,71 @@ class Habit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     color = models.CharField(max_length=24, default="#9be9a8")
 
+    # Streak state, maintained incrementally as check-ins are added/removed.
+    # ``longest_run`` is NULL until the state has been built for this habit.
+    current_run_start = models.DateField(null=True, blank=True)
+    last_checkin_date = models.DateField(null=True, blank=True)
+    longest_run = models.PositiveIntegerField(null=True, blank=True)
+
+    STREAK_FIELDS = ("current_run_start", "last_checkin_date", "longest_run")
+
     def __str__(self):
         return f"Habit: {self.name}"
 
-    def current_streak(self):
-        dates = set(self.checkins.order_by("-date").values_list("date", flat=True))  # type: ignore
-        if not dates:
+    def current_run_length(self):
+        if self.last_checkin_date is None or self.current_run_start is None:
             return 0
+        return (self.last_checkin_date - self.current_run_start).days + 1
 
-        streak = 0
-        day = timezone.localdate()
-        while day in dates:
-            streak += 1
-            day = day - timedelta(days=1)
-        return streak
+    def current_streak(self):
+        self.ensure_streak_state()
+        if self.last_checkin_date != timezone.localdate():
+            return 0
+        return self.current_run_length()
 
     def longest_streak(self):
-        dates_qs = self.checkins.order_by("date").values_list("date", flat=True)  # type: ignore
-        dates = list(dict.fromkeys(dates_qs))
-        if not dates:
-            return 0
+        self.ensure_streak_state()
+        return self.longest_run
 
-        max_streak = 1
-        current = 1
-        prev = dates[0]
-        for d in dates[1:]:
-            if d == prev + timedelta(days=1):
-                current += 1
-            else:
-                current = 1
-            if current > max_streak:
-                max_streak = current
-            prev = d
-        return max_streak
+    def ensure_streak_state(self):
+        if self.longest_run is None:
+            self.rebuild_streak_state()
+
+    def rebuild_streak_state(self, save=True):
+        """Recompute the streak state from every check-in of this habit."""
+        dates = self.checkins.order_by("date").values_list("date", flat=True)  # type: ignore
+        self.current_run_start, self.last_checkin_date, self.longest_run = summarize_runs(dates)
+        if save and self.pk:
+            self.save(update_fields=self.STREAK_FIELDS)
+
+    def record_checkin_added(self, day):
+        """Update the streak state for a newly created check-in on ``day``."""
+        last = self.last_checkin_date
+        if self.longest_run is None or (last is not None and day <= last):
+            # back-filled history may merge runs; rebuild from scratch
+            self.rebuild_streak_state()
+            return
+
+        if last is not None and day == last + timedelta(days=1):
+            self.last_checkin_date = day
+        else:
+            self.current_run_start = self.last_checkin_date = day
+        self.longest_run = max(self.longest_run, self.current_run_length())
+        self.save(update_fields=self.STREAK_FIELDS)
+
+    def record_checkin_removed(self, day):
+        """Update the streak state after the check-in on ``day`` was deleted."""
+        run = self.current_run_length()
+        if (
+            self.longest_run is not None
+            and day == self.last_checkin_date
+            and 1 < run < self.longest_run
+        ):
+            # the longest run lies elsewhere, so only the current run shrinks
+            self.last_checkin_date = day - timedelta(days=1)
+            self.save(update_fields=self.STREAK_FIELDS)
+            return
+        self.rebuild_streak_state()
 
 
 def get_color_for_count(count: int) -> str:
@@ -63,33 +117,142 @@ def get_color_for_count(count: int) -> str:
 
 
 class CheckIn(models.Model):
+    """A habit done on a day.
+
+    Write check-ins through ``habits.checkin_service`` (as the API and admin
+    do): plain ``objects.create()``/``delete()`` skip the daily rollup, the
+    habit's streak fields and XP. After such writes run ``rebuild_daily_counts``
+    and ``Habit.rebuild_streak_state()`` for the affected habits.
+    """
+
     # Denormalized user id to quickly filter per-user checkins
-    user_id = models.CharField(max_length=128, db_index=True, blank=True, default="")
+    user_id = models.CharField(max_length=128, blank=True, default="")
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="checkins")
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
+            # also the (habit, date) index for per-habit streaks and stats
             models.UniqueConstraint(fields=["habit", "date"], name="uniq_checkin")
         ]
+        indexes = [
+            # per-user date ranges and the (date, id) keyset of the check-in list
+            models.Index(fields=["user_id", "-date", "-id"], name="checkin_user_date_idx"),
+        ]
         ordering = ["-date"]
 
     def __str__(self):
         return f"CheckIn: {self.habit.name} on {self.date}"
 
     @classmethod
-    def count_for_date(cls, date):
-        return cls.objects.filter(date=date).count()
+    def count_for_date(cls, user_id, date):
+        """Check-ins the user made on ``date``, from the daily rollup."""
+        row = DailyCheckInCount.objects.filter(user_id=user_id, date=date).values_list("count", flat=True)
+        return row.first() or 0
 
     @classmethod
-    def color_for_date(cls, date):
-
-        return get_color_for_count(cls.count_for_date(date))
+    def color_for_date(cls, user_id, date):
+        return get_color_for_count(cls.count_for_date(user_id, date))
 
     def color(self):
+        return self.__class__.color_for_date(self.user_id, self.date)
+
+
+class DailyCheckInCount(models.Model):
+    """Rollup of CheckIn: number of check-ins a user made on a given day."""
+
+    user_id = models.CharField(max_length=128)
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "date"], name="uniq_daily_checkin_count")
+        ]
+
+    def __str__(self):
+        return f"DailyCheckInCount({self.user_id}, {self.date}, {self.count})"
+
+    @classmethod
+    def adjust(cls, user_id, day, delta):
+        """Add ``delta`` to the user's count for ``day``, creating/removing the row."""
+        rows = cls.objects.filter(user_id=user_id, date=day)
+        if rows.update(count=F("count") + delta):
+            if delta < 0:
+                rows.filter(count__lte=0).delete()
+            return
+        if delta <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, date=day, count=delta)
+        except IntegrityError:
+            # created concurrently by another request
+            rows.update(count=F("count") + delta)
+
+    @classmethod
+    def rebuild(cls, user_id=None, dates=None, batch_size=1000):
+        """Recompute rows from CheckIn, optionally only for one user and/or some dates."""
+        checkins = CheckIn.objects.all()
+        existing = cls.objects.all()
+        if user_id is not None:
+            checkins = checkins.filter(user_id=user_id)
+            existing = existing.filter(user_id=user_id)
+        if dates is not None:
+            dates = list(dates)
+            checkins = checkins.filter(date__in=dates)
+            existing = existing.filter(date__in=dates)
+
+        aggregated = (
+            checkins.values("user_id", "date").annotate(total=Count("id")).order_by().iterator()
+        )
+        created = 0
+        with transaction.atomic():
+            existing.delete()
+            while True:
+                batch = [
+                    cls(user_id=row["user_id"], date=row["date"], count=row["total"])
+                    for row in islice(aggregated, batch_size)
+                ]
+                if not batch:
+                    break
+                cls.objects.bulk_create(batch)
+                created += len(batch)
+        return created
+
+
+def checkin_dates_by_habit(habits):
+    """Return ``{habit_id: [dates ascending]}`` for ``habits`` with one query."""
+    dates_by_habit = defaultdict(list)
+    rows = (
+        CheckIn.objects.filter(habit__in=habits)
+        .order_by("habit_id", "date")
+        .values_list("habit_id", "date")
+    )
+    for habit_id, d in rows:
+        dates_by_habit[habit_id].append(d)
+    return dates_by_habit
+
+
+def ensure_streak_states(habits):
+    """Build the missing streak state of ``habits`` with a single check-in query."""
+    missing = [h for h in habits if h.longest_run is None]
+    if not missing:
+        return
 
-        return self.__class__.color_for_date(self.date)
+    dates_by_habit = checkin_dates_by_habit(missing)
+    for h in missing:
+        h.current_run_start, h.last_checkin_date, h.longest_run = summarize_runs(
+            dates_by_habit.get(h.pk, ())
+        )
+    Habit.objects.bulk_update(missing, Habit.STREAK_FIELDS)
+
+
+def habit_streaks(habits):
+    """Return ``{habit_id: (current_streak, longest_streak)}`` for ``habits``."""
+    ensure_streak_states(habits)
+    return {h.pk: (h.current_streak(), h.longest_streak()) for h in habits}
 
 
 class UserStats(models.Model):
@@ -97,22 +260,112 @@ class UserStats(models.Model):
     user_id = models.CharField(max_length=128, unique=True, db_index=True)
     display_name = models.CharField(max_length=255, blank=True, default="")
     xp_total = models.IntegerField(default=0)
+    # Bumped on every habit, check-in or XP write; used for conditional GETs
+    data_version = models.PositiveBigIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # live leaderboard order and the snapshot refresh
+            models.Index(models.F("xp_total").desc(), "user_id", name="userstats_xp_user_idx"),
+        ]
+
     def __str__(self):
         return f"UserStats({self.user_id})"
 
+    @classmethod
+    def bump_data_version(cls, user_id):
+        """Mark the user's data as changed so cached responses are revalidated."""
+        rows = cls.objects.filter(user_id=user_id)
+        changes = {"data_version": F("data_version") + 1, "updated_at": timezone.now()}
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, data_version=1)
+        except IntegrityError:
+            rows.update(**changes)
+
+
+class LeaderboardEntry(models.Model):
+    """Snapshot of UserStats ranked by XP, rebuilt by ``refresh_leaderboard``.
+
+    Ranks are stored so pages, a user's position and their neighbors are
+    index lookups instead of sorting every UserStats row per request.
+    """
+
+    rank = models.PositiveIntegerField(unique=True)
+    user_id = models.CharField(max_length=128, unique=True)
+    display_name = models.CharField(max_length=255, blank=True, default="")
+    xp_total = models.IntegerField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["rank"]
+        indexes = [
+            # position estimate for users who joined after the last refresh
+            models.Index(models.F("xp_total").desc(), "rank", name="leaderboard_xp_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"LeaderboardEntry(#{self.rank} {self.user_id})"
+
+    @classmethod
+    def refresh(cls, batch_size=5000):
+        """Replace the snapshot with the current ranking; returns the row count."""
+        refreshed_at = timezone.now()
+        ranked = enumerate(
+            UserStats.objects.order_by("-xp_total", "user_id")
+            .values_list("user_id", "display_name", "xp_total")
+            .iterator(chunk_size=batch_size),
+            start=1,
+        )
+        total = 0
+        with transaction.atomic():
+            cls.objects.all().delete()
+            while True:
+                batch = [
+                    cls(
+                        rank=rank,
+                        user_id=user_id,
+                        display_name=display_name,
+                        xp_total=xp_total,
+                        refreshed_at=refreshed_at,
+                    )
+                    for rank, (user_id, display_name, xp_total) in islice(ranked, batch_size)
+                ]
+                if not batch:
+                    break
+                cls.objects.bulk_create(batch)
+                total += len(batch)
+        return total
+
+    @classmethod
+    def estimate_rank(cls, xp_total):
+        """Rank a user with ``xp_total`` would take in the current snapshot."""
+        below = (
+            cls.objects.filter(xp_total__lte=xp_total)
+            .order_by("-xp_total", "rank")
+            .values_list("rank", flat=True)
+            .first()
+        )
+        if below is not None:
+            return below
+        last = cls.objects.order_by("-rank").values_list("rank", flat=True).first()
+        return (last or 0) + 1
+
 
 class XpEvent(models.Model):
     """Tracks XP awards to prevent double-crediting the same habit/date."""
 
-    user_id = models.CharField(max_length=128, db_index=True)
+    user_id = models.CharField(max_length=128)
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="xp_events")
     date = models.DateField()
     awarded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
+            # leads with user_id, so it serves the per-user lookups as well
             models.UniqueConstraint(
                 fields=["user_id", "habit", "date"], name="uniq_xp_event"
             )
@@ -141,3 +394,40 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f"Subscription({self.user_id}, active={self.is_active})"
+
+
+class SubscriptionPayment(models.Model):
+    """
+    SubscriptionPurchased event indexed from the subscription contract
+    Lets registration verify a payment without an RPC round trip
+    """
+
+    # Lower-case 0x-prefixed hash of the paying transaction
+    tx_hash = models.CharField(max_length=66, db_index=True)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField(db_index=True)
+    # Checksummed address that paid (the event's indexed buyer)
+    buyer = models.CharField(max_length=42, db_index=True)
+    amount_wei = models.DecimalField(max_digits=78, decimal_places=0)
+    paid_at = models.DateTimeField()
+    indexed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tx_hash", "log_index"], name="uniq_subscription_payment_log")
+        ]
+
+    def __str__(self):
+        return f"SubscriptionPayment({self.buyer}, {self.tx_hash})"
+
+
+class IndexerCheckpoint(models.Model):
+    """Last block fully processed by a chain indexer"""
+
+    # e.g. "subscriptions:<contract address>"
+    name = models.CharField(max_length=128, unique=True)
+    block_number = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"IndexerCheckpoint({self.name}, {self.block_number})"
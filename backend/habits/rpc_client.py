@@ -0,0 +1,405 @@
+"""
+Blockchain RPC client - pooled HTTP sessions with explicit timeouts, a circuit
+breaker per endpoint and optional hedged requests across several RPC URLs
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3  # type: ignore
+
+from config.metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+# Comma separated list, tried in order; falls back to SUBSCRIPTION_RPC_URL
+RPC_URLS = [
+    url.strip()
+    for url in os.getenv(
+        "SUBSCRIPTION_RPC_URLS", os.getenv("SUBSCRIPTION_RPC_URL", "http://127.0.0.1:8545")
+    ).split(",")
+    if url.strip()
+]
+# Seconds to connect / to wait for a response from a single node
+RPC_CONNECT_TIMEOUT = float(os.getenv("SUBSCRIPTION_RPC_CONNECT_TIMEOUT", "2"))
+RPC_READ_TIMEOUT = float(os.getenv("SUBSCRIPTION_RPC_TIMEOUT", "5"))
+# Seconds to wait on a node before also asking the next one (0 disables hedging)
+RPC_HEDGE_DELAY = float(os.getenv("SUBSCRIPTION_RPC_HEDGE_DELAY", "0.5"))
+# Consecutive failures that open an endpoint's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+# Pooled connections kept per endpoint
+POOL_SIZE = 10
+
+# Seconds contract view results are served from memory
+CONTRACT_READ_TTL = float(os.getenv("SUBSCRIPTION_CONTRACT_READ_TTL", "300"))
+
+# Errors that mean the node itself is unhealthy (as opposed to e.g. an unknown tx)
+NODE_ERRORS = (requests.RequestException, ConnectionError, TimeoutError)
+ASYNC_NODE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, TimeoutError)
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rpc")
+
+
+class RpcUnavailable(Exception):
+    """No RPC endpoint answered, or every circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed until ``failure_threshold`` consecutive failures, then open (calls
+    fail fast) for ``reset_timeout`` seconds, after which a single trial call
+    is let through (half-open)
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            # half-open: let this call through, everyone else waits for another window
+            self._opened_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """Circuit breaker of an RPC URL, shared by the sync and async clients"""
+    with _breakers_lock:
+        if url not in _breakers:
+            _breakers[url] = CircuitBreaker()
+        return _breakers[url]
+
+
+class RpcEndpoint:
+    """A Web3 instance on a pooled session, guarded by the URL's circuit breaker"""
+
+    def __init__(self, url: str):
+        self.url = url
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.w3 = Web3(
+            Web3.HTTPProvider(
+                url,
+                request_kwargs={"timeout": (RPC_CONNECT_TIMEOUT, RPC_READ_TIMEOUT)},
+                session=session,
+            )
+        )
+        # web3's default retry middleware would repeat a timed-out call 5 times;
+        # failover and the circuit breaker are handled here instead
+        self.w3.provider.middlewares = ()
+        self.breaker = breaker_for(url)
+
+    def call(self, fn: Callable):
+        try:
+            result = fn(self.w3)
+        except NODE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # the node answered, the request itself was bad
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+
+class RpcClient:
+    """
+    Runs ``fn(w3)`` against the configured endpoints
+    Endpoints with an open circuit are skipped; with hedging enabled the next
+    endpoint is asked as well whenever the previous one has not answered within
+    ``hedge_delay``, and the first answer wins. A call never waits longer than
+    the per-node read timeout plus the hedge delays
+    """
+
+    def __init__(self, urls: List[str], hedge_delay: float = RPC_HEDGE_DELAY):
+        self.endpoints = [RpcEndpoint(url) for url in urls]
+        self.hedge_delay = hedge_delay
+
+    @property
+    def available(self) -> bool:
+        return any(not endpoint.breaker.is_open for endpoint in self.endpoints)
+
+    def _candidates(self):
+        # allow() is only asked right before an endpoint is tried: it spends the
+        # single half-open trial of a recovering endpoint
+        candidates = [endpoint for endpoint in self.endpoints if not endpoint.breaker.is_open]
+        if not candidates:
+            raise RpcUnavailable("All RPC endpoints are unavailable")
+        return candidates
+
+    def call(self, fn: Callable):
+        candidates = self._candidates()
+        with external_call("rpc"):
+            if len(candidates) == 1 or self.hedge_delay <= 0:
+                return self._call_in_order(candidates, fn)
+            return self._call_hedged(candidates, fn)
+
+    def _call_in_order(self, candidates, fn):
+        last_error = None
+        for endpoint in candidates:
+            if not endpoint.breaker.allow():
+                continue
+            try:
+                return endpoint.call(fn)
+            except NODE_ERRORS as e:
+                logger.warning(f"RPC call to {endpoint.url} failed: {e}")
+                last_error = e
+        raise RpcUnavailable(f"All RPC endpoints failed: {last_error or 'circuits open'}")
+
+    def _call_hedged(self, candidates, fn):
+        deadline = time.monotonic() + RPC_CONNECT_TIMEOUT + RPC_READ_TIMEOUT
+        remaining = list(candidates)
+        pending = {}
+        last_error = None
+
+        while remaining or pending:
+            if remaining:
+                endpoint = remaining.pop(0)
+                if not endpoint.breaker.allow():
+                    continue
+                pending[_executor.submit(endpoint.call, fn)] = endpoint
+                # give the node a head start before hedging to the next one
+                timeout = self.hedge_delay if remaining else max(deadline - time.monotonic(), 0)
+            else:
+                timeout = max(deadline - time.monotonic(), 0)
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    return future.result()
+                except NODE_ERRORS as e:
+                    logger.warning(f"RPC call to {endpoint.url} failed: {e}")
+                    last_error = e
+            if not done and not remaining:
+                break
+
+        raise RpcUnavailable(f"No RPC endpoint answered in time: {last_error or 'timed out'}")
+
+
+class AsyncRpcEndpoint:
+    """An AsyncWeb3 instance (aiohttp sessions are pooled per event loop by web3)"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.w3 = AsyncWeb3(
+            AsyncHTTPProvider(
+                url,
+                request_kwargs={
+                    "timeout": aiohttp.ClientTimeout(
+                        total=RPC_CONNECT_TIMEOUT + RPC_READ_TIMEOUT, connect=RPC_CONNECT_TIMEOUT
+                    )
+                },
+            )
+        )
+        # no retry middleware: one attempt per node, see RpcEndpoint
+        self.w3.provider.middlewares = ()
+        self.breaker = breaker_for(url)
+
+    async def call(self, fn: Callable):
+        try:
+            result = await fn(self.w3)
+        except ASYNC_NODE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+
+class AsyncRpcClient(RpcClient):
+    """
+    ``RpcClient`` for async views: ``fn(w3)`` returns an awaitable and the
+    call never blocks the event loop, so one worker can wait on many nodes
+    """
+
+    def __init__(self, urls: List[str], hedge_delay: float = RPC_HEDGE_DELAY):
+        self.endpoints = [AsyncRpcEndpoint(url) for url in urls]
+        self.hedge_delay = hedge_delay
+
+    async def call(self, fn: Callable):
+        candidates = self._candidates()
+        with external_call("rpc"):
+            if len(candidates) == 1 or self.hedge_delay <= 0:
+                return await self._call_in_order(candidates, fn)
+            return await self._call_hedged(candidates, fn)
+
+    async def _call_in_order(self, candidates, fn):
+        last_error = None
+        for endpoint in candidates:
+            if not endpoint.breaker.allow():
+                continue
+            try:
+                return await endpoint.call(fn)
+            except ASYNC_NODE_ERRORS as e:
+                logger.warning(f"RPC call to {endpoint.url} failed: {e}")
+                last_error = e
+        raise RpcUnavailable(f"All RPC endpoints failed: {last_error or 'circuits open'}")
+
+    async def _call_hedged(self, candidates, fn):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + RPC_CONNECT_TIMEOUT + RPC_READ_TIMEOUT
+        remaining = list(candidates)
+        pending = {}
+        last_error = None
+
+        try:
+            while remaining or pending:
+                if remaining:
+                    endpoint = remaining.pop(0)
+                    if not endpoint.breaker.allow():
+                        continue
+                    pending[asyncio.ensure_future(endpoint.call(fn))] = endpoint
+                    # give the node a head start before hedging to the next one
+                    timeout = self.hedge_delay if remaining else max(deadline - loop.time(), 0)
+                else:
+                    timeout = max(deadline - loop.time(), 0)
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        return task.result()
+                    except ASYNC_NODE_ERRORS as e:
+                        logger.warning(f"RPC call to {endpoint.url} failed: {e}")
+                        last_error = e
+                if not done and not remaining:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise RpcUnavailable(f"No RPC endpoint answered in time: {last_error or 'timed out'}")
+
+
+class TtlCache:
+    """
+    In-process cache of loaded values, each kept for ``ttl`` seconds
+    Single-flight: one caller reloads an expired key while the others get
+    the stale value (or, on first load, wait for the result). Failed loads
+    are not cached
+    """
+
+    def __init__(self, ttl: float = CONTRACT_READ_TTL):
+        self.ttl = ttl
+        self._values = {}
+        self._locks = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load: Callable):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        # serve the stale value instead of queueing behind a reload in flight
+        if entry is not None and not key_lock.acquire(blocking=False):
+            return entry[0]
+        if entry is None:
+            key_lock.acquire()
+        try:
+            entry = self._values.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            value = load()
+            self._values[key] = (value, time.monotonic() + self.ttl)
+            return value
+        finally:
+            key_lock.release()
+
+    async def aget(self, key, load: Callable):
+        """``get`` for coroutine loaders; concurrent callers share one load task"""
+        entry = self._values.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        task = self._tasks.get(key)
+        in_flight = (
+            task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop()
+        )
+        if in_flight and entry is not None:
+            return entry[0]
+        if not in_flight:
+            task = self._tasks[key] = asyncio.ensure_future(self._aload(key, load))
+        return await asyncio.shield(task)
+
+    async def _aload(self, key, load: Callable):
+        value = await load()
+        self._values[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_rpc_client() -> RpcClient:
+    """Get or create the shared RPC client (no network access until first call)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RpcClient(RPC_URLS)
+    return _client
+
+
+_async_client = None
+
+
+def get_async_rpc_client() -> AsyncRpcClient:
+    """Get or create the shared async RPC client"""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncRpcClient(RPC_URLS)
+    return _async_client
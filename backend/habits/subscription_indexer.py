@@ -0,0 +1,121 @@
+"""
+Subscription indexer - reads SubscriptionPurchased events from the contract in
+block ranges and stores them as SubscriptionPayment rows, so payments can be
+verified with a local lookup
+"""
+import logging
+import os
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Tuple
+
+from django.db import transaction
+from web3 import Web3  # type: ignore
+
+from .models import IndexerCheckpoint, Subscription, SubscriptionPayment
+from .rpc_client import RpcClient
+
+logger = logging.getLogger(__name__)
+
+# Block the contract was deployed at; nothing earlier is scanned
+START_BLOCK = int(os.getenv("SUBSCRIPTION_START_BLOCK", "0"))
+# Blocks per eth_getLogs request (providers commonly cap ranges or results)
+BLOCK_RANGE = int(os.getenv("SUBSCRIPTION_INDEXER_BLOCK_RANGE", "2000"))
+# Only blocks this deep are indexed, so reorgs do not leave stale payments behind
+CONFIRMATIONS = int(os.getenv("SUBSCRIPTION_INDEXER_CONFIRMATIONS", "2"))
+
+SUBSCRIPTION_PURCHASED_ABI = {
+    "anonymous": False,
+    "inputs": [
+        {"indexed": True, "name": "buyer", "type": "address"},
+        {"indexed": False, "name": "amount", "type": "uint256"},
+        {"indexed": False, "name": "timestamp", "type": "uint256"},
+    ],
+    "name": "SubscriptionPurchased",
+    "type": "event",
+}
+SUBSCRIPTION_PURCHASED_TOPIC = Web3.keccak(text="SubscriptionPurchased(address,uint256,uint256)").hex()
+
+# Decoding needs the ABI codec only, never the network
+_event = Web3().eth.contract(abi=[SUBSCRIPTION_PURCHASED_ABI]).events.SubscriptionPurchased()
+
+
+def checkpoint_name(contract_address: str) -> str:
+    return f"subscriptions:{contract_address.lower()}"
+
+
+def payments_from_logs(logs, contract_address: str) -> List[SubscriptionPayment]:
+    """Decode the contract's SubscriptionPurchased logs, skipping anything else"""
+    payments = []
+    for log in logs:
+        if log["address"].lower() != contract_address.lower():
+            continue
+        topics = log["topics"]
+        if not topics or Web3.to_hex(topics[0]) != SUBSCRIPTION_PURCHASED_TOPIC:
+            continue
+        event = _event.process_log(log)
+        payments.append(
+            SubscriptionPayment(
+                tx_hash=Web3.to_hex(log["transactionHash"]).lower(),
+                log_index=log["logIndex"],
+                block_number=log["blockNumber"],
+                buyer=Web3.to_checksum_address(event["args"]["buyer"]),
+                amount_wei=event["args"]["amount"],
+                paid_at=datetime.fromtimestamp(event["args"]["timestamp"], tz=dt_timezone.utc),
+            )
+        )
+    return payments
+
+
+def store_payments(payments: List[SubscriptionPayment]) -> int:
+    """
+    Insert payments (already indexed ones are ignored) and re-activate
+    subscriptions of the paying wallets; returns the number of payments given
+    """
+    if not payments:
+        return 0
+    from .subscription_service import invalidate_entitlement
+
+    SubscriptionPayment.objects.bulk_create(payments, batch_size=500, ignore_conflicts=True)
+
+    buyers = {payment.buyer for payment in payments}
+    inactive = list(
+        Subscription.objects.filter(wallet_address__in=buyers, is_active=False).values_list("user_id", flat=True)
+    )
+    if inactive:
+        Subscription.objects.filter(user_id__in=inactive).update(is_active=True)
+        for user_id in inactive:
+            invalidate_entitlement(user_id)
+    return len(payments)
+
+
+def sync(rpc: RpcClient, contract_address: str, to_block=None) -> Tuple[int, int, int]:
+    """
+    Index the contract's events from the checkpoint up to ``to_block`` (default:
+    the latest confirmed block), one block range per transaction
+    Returns (from_block, to_block, payments)
+    """
+    address = Web3.to_checksum_address(contract_address)
+    name = checkpoint_name(address)
+    checkpoint = IndexerCheckpoint.objects.filter(name=name).first()
+    start = checkpoint.block_number + 1 if checkpoint else START_BLOCK
+    if to_block is None:
+        to_block = rpc.call(lambda w3: w3.eth.block_number) - CONFIRMATIONS
+
+    total = 0
+    for from_block in range(start, to_block + 1, BLOCK_RANGE):
+        end = min(from_block + BLOCK_RANGE - 1, to_block)
+        logs = rpc.call(
+            lambda w3: w3.eth.get_logs(
+                {
+                    "address": address,
+                    "topics": [SUBSCRIPTION_PURCHASED_TOPIC],
+                    "fromBlock": from_block,
+                    "toBlock": end,
+                }
+            )
+        )
+        with transaction.atomic():
+            total += store_payments(payments_from_logs(logs, address))
+            IndexerCheckpoint.objects.update_or_create(name=name, defaults={"block_number": end})
+        logger.info(f"Indexed blocks {from_block}-{end} of {address}: {len(logs)} events")
+    return start, to_block, total
@@ -4,67 +4,225 @@ Handles subscription state and habit limit enforcement
 """
 import os
 from typing import Optional, Tuple
+from asgiref.sync import sync_to_async
 from web3 import Web3  # type: ignore
+from web3.exceptions import TransactionNotFound  # type: ignore
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.utils import timezone
-from .models import Subscription
+from .models import Subscription, SubscriptionPayment
+from .rpc_client import RpcUnavailable, TtlCache, get_async_rpc_client, get_rpc_client
+from .subscription_indexer import payments_from_logs, store_payments
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Contract details for payment verification
 CONTRACT_ADDRESS = os.getenv("SUBSCRIPTION_CONTRACT_ADDRESS", "")
-RPC_URL = os.getenv("SUBSCRIPTION_RPC_URL", "http://127.0.0.1:8545")
+
+# View functions of the subscription contract read by the backend
+SUBSCRIPTION_CONTRACT_ABI = [
+    {
+        "inputs": [],
+        "name": "subscriptionPrice",
+        "outputs": [{"type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+]
 
 # Free tier limit
 FREE_TIER_LIMIT = 5
 
+# Cached per-user entitlement (subscription status + habit count); entries are
+# dropped whenever either changes, the TTL only bounds out-of-band edits
+ENTITLEMENT_CACHE_PREFIX = "entitlement:"
+ENTITLEMENT_CACHE_TTL = 60 * 60
+# With a per-process cache (LocMemCache) an invalidation only reaches the worker
+# that made the change, so other workers may serve a stale entry this long
+ENTITLEMENT_LOCAL_CACHE_TTL = 5
+
+NO_SUBSCRIPTION = {
+    "is_premium": False,
+    "is_active": False,
+    "wallet_address": None,
+    "tx_hash": None,
+}
+
+
+def entitlement_cache_ttl() -> int:
+    """Seconds to cache an entitlement, short unless the cache is shared by all workers"""
+    if isinstance(caches["default"], LocMemCache):
+        return ENTITLEMENT_LOCAL_CACHE_TTL
+    return ENTITLEMENT_CACHE_TTL
+
+
+def invalidate_entitlement(user_id: str) -> None:
+    """Drop the cached entitlement after a subscription or habit change"""
+    cache.delete(f"{ENTITLEMENT_CACHE_PREFIX}{user_id}")
+
 
 class SubscriptionService:
     """Service for managing subscriptions with blockchain verification"""
 
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(RPC_URL))
-        self.is_connected = False
-
-        if not self.w3.is_connected():
-            logger.warning(f"Failed to connect to RPC at {RPC_URL}")
-            return
+    def __init__(self, rpc=None, async_rpc=None):
+        # connects lazily; unreachable nodes are handled per call by the client
+        self.rpc = rpc or get_rpc_client()
+        self.async_rpc = async_rpc or get_async_rpc_client()
+        # offline contract, only used to encode calls and decode results
+        self.contract = None
+        if CONTRACT_ADDRESS:
+            self.contract = Web3().eth.contract(
+                address=Web3.to_checksum_address(CONTRACT_ADDRESS),
+                abi=SUBSCRIPTION_CONTRACT_ABI,
+            )
+        self.contract_reads = TtlCache()
 
-        self.is_connected = True
-        logger.info(f"Connected to RPC at {RPC_URL}")
+    @property
+    def is_connected(self) -> bool:
+        """False while every RPC endpoint's circuit is open"""
+        return self.rpc.available
 
-    def verify_transaction(self, tx_hash: str) -> Tuple[bool, str]:
+    def verify_transaction(self, tx_hash: str, wallet_address: Optional[str] = None) -> Tuple[bool, str]:
         """
-        Verify a transaction was successful on the blockchain
+        Verify a transaction paid for a subscription (from ``wallet_address``
+        when given)
+        Indexed payments are a local lookup; a payment the indexer has not
+        reached yet is indexed from its receipt
         Returns (is_valid, message)
         """
-        if not self.is_connected:
-            logger.warning("Blockchain service not connected")
+        tx_hash = tx_hash.lower()
+        payment = SubscriptionPayment.objects.filter(tx_hash=tx_hash).first()
+
+        if payment is None:
+            try:
+                # Check if transaction exists and was successful
+                tx = self.rpc.call(lambda w3: w3.eth.get_transaction_receipt(tx_hash))  # type: ignore
+            except Exception as e:
+                return self._receipt_error(tx_hash, e)
+
+            problem = self._receipt_problem(tx)
+            if problem is not None:
+                return problem
+
+            store_payments(payments_from_logs(tx["logs"], CONTRACT_ADDRESS))
+            payment = SubscriptionPayment.objects.filter(tx_hash=tx_hash).first()
+
+        return self._check_payment(payment, wallet_address)
+
+    async def averify_transaction(self, tx_hash: str, wallet_address: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Async ``verify_transaction``; the receipt is fetched without blocking
+        the event loop
+        """
+        tx_hash = tx_hash.lower()
+        payment = await SubscriptionPayment.objects.filter(tx_hash=tx_hash).afirst()
+
+        if payment is None:
+            try:
+                tx = await self.async_rpc.call(lambda w3: w3.eth.get_transaction_receipt(tx_hash))  # type: ignore
+            except Exception as e:
+                return self._receipt_error(tx_hash, e)
+
+            problem = self._receipt_problem(tx)
+            if problem is not None:
+                return problem
+
+            await sync_to_async(store_payments)(payments_from_logs(tx["logs"], CONTRACT_ADDRESS))
+            payment = await SubscriptionPayment.objects.filter(tx_hash=tx_hash).afirst()
+
+        return self._check_payment(payment, wallet_address)
+
+    @staticmethod
+    def _receipt_error(tx_hash: str, e: Exception) -> Tuple[bool, str]:
+        if isinstance(e, TransactionNotFound):
+            return False, "Transaction not found on blockchain"
+        if isinstance(e, RpcUnavailable):
+            logger.warning(f"Blockchain service unavailable verifying {tx_hash}: {e}")
             return False, "Blockchain service unavailable"
+        logger.error(f"Error verifying transaction {tx_hash}: {e}")
+        return False, f"Error verifying transaction: {str(e)}"
 
-        try:
-            # Check if transaction exists and was successful
-            tx = self.w3.eth.get_transaction_receipt(tx_hash) # type: ignore
-            
-            if tx is None:
-                return False, "Transaction not found on blockchain"
+    @staticmethod
+    def _receipt_problem(tx) -> Optional[Tuple[bool, str]]:
+        """Verification result decided by the receipt alone, if any"""
+        if tx is None:
+            return False, "Transaction not found on blockchain"
 
-            if tx['status'] != 1:
-                return False, "Transaction failed"
+        if tx['status'] != 1:
+            return False, "Transaction failed"
 
+        if not CONTRACT_ADDRESS:
+            # no contract to match the payment against (local development)
             return True, "Transaction verified"
+        return None
 
-        except Exception as e:
-            logger.error(f"Error verifying transaction {tx_hash}: {e}")
-            return False, f"Error verifying transaction: {str(e)}"
+    @staticmethod
+    def _check_payment(payment, wallet_address: Optional[str]) -> Tuple[bool, str]:
+        if payment is None:
+            return False, "Transaction is not a subscription purchase"
+
+        if wallet_address and payment.buyer != Web3.to_checksum_address(wallet_address):
+            return False, "Payment was made from a different wallet"
+
+        return True, "Payment verified"
+
+    @staticmethod
+    def _entitlement(subscription, habit_count: int) -> dict:
+        if subscription:
+            status = {
+                "is_premium": subscription.is_active,
+                "is_active": subscription.is_active,
+                "wallet_address": subscription.wallet_address,
+                "tx_hash": subscription.tx_hash,
+                "created_at": subscription.created_at.isoformat(),
+            }
+        else:
+            status = dict(NO_SUBSCRIPTION)
+        return {"subscription": status, "habit_count": habit_count}
+
+    def get_entitlement(self, user_id: str, fresh: bool = False) -> dict:
+        """
+        Get the user's subscription status and habit count
+        Served from the cache; loaded from the database after an invalidation,
+        or when ``fresh`` (e.g. to recheck a cached denial)
+        """
+        key = f"{ENTITLEMENT_CACHE_PREFIX}{user_id}"
+        entitlement = None if fresh else cache.get(key)
+        if entitlement is not None:
+            return entitlement
+
+        from .models import Habit
+
+        entitlement = self._entitlement(
+            Subscription.objects.filter(user_id=user_id).first(),
+            Habit.objects.filter(user_id=user_id).count(),
+        )
+        cache.set(key, entitlement, entitlement_cache_ttl())
+        return entitlement
+
+    async def aget_entitlement(self, user_id: str) -> dict:
+        """Async ``get_entitlement``"""
+        key = f"{ENTITLEMENT_CACHE_PREFIX}{user_id}"
+        entitlement = await cache.aget(key)
+        if entitlement is not None:
+            return entitlement
+
+        from .models import Habit
+
+        entitlement = self._entitlement(
+            await Subscription.objects.filter(user_id=user_id).afirst(),
+            await Habit.objects.filter(user_id=user_id).acount(),
+        )
+        await cache.aset(key, entitlement, entitlement_cache_ttl())
+        return entitlement
 
     def is_premium_user(self, user_id: str) -> bool:
         """
         Check if user has premium subscription (local check)
         """
         try:
-            subscription = Subscription.objects.filter(user_id=user_id).first()
-            return subscription is not None and subscription.is_active
+            return self.get_entitlement(user_id)["subscription"]["is_active"]
         except Exception as e:
             logger.error(f"Error checking premium status for user {user_id}: {e}")
             return False
@@ -74,47 +232,40 @@ class SubscriptionService:
         Get subscription status for a user
         """
         try:
-            subscription = Subscription.objects.filter(user_id=user_id).first()
+            return dict(self.get_entitlement(user_id)["subscription"])
 
-            if not subscription:
-                return {
-                    "is_premium": False,
-                    "is_active": False,
-                    "wallet_address": None,
-                    "tx_hash": None,
-                }
+        except Exception as e:
+            logger.error(f"Error getting subscription status for user {user_id}: {e}")
+            return self._status_unavailable()
 
-            return {
-                "is_premium": subscription.is_active,
-                "is_active": subscription.is_active,
-                "wallet_address": subscription.wallet_address,
-                "tx_hash": subscription.tx_hash,
-                "created_at": subscription.created_at.isoformat(),
-            }
+    async def aget_subscription_status(self, user_id: str) -> dict:
+        """Async ``get_subscription_status``"""
+        try:
+            return dict((await self.aget_entitlement(user_id))["subscription"])
 
         except Exception as e:
             logger.error(f"Error getting subscription status for user {user_id}: {e}")
-            return {
-                "is_premium": False,
-                "is_active": False,
-                "wallet_address": None,
-            }
+            return self._status_unavailable()
 
-    def can_create_habit(self, user_id: str) -> Tuple[bool, str]:
+    @staticmethod
+    def _status_unavailable() -> dict:
+        return {
+            "is_premium": False,
+            "is_active": False,
+            "wallet_address": None,
+        }
+
+    def can_create_habit(self, user_id: str, fresh: bool = False) -> Tuple[bool, str]:
         """
         Check if user can create a new habit
+        ``fresh`` reads the database instead of the cache, to recheck a denial
         Returns (can_create, reason)
         """
         try:
-            from .models import Habit
-
-            # Count existing habits
-            habit_count = Habit.objects.filter(user_id=user_id).count()
-
-            # Check if premium
-            is_premium = self.is_premium_user(user_id)
+            entitlement = self.get_entitlement(user_id, fresh=fresh)
+            habit_count = entitlement["habit_count"]
 
-            if is_premium:
+            if entitlement["subscription"]["is_active"]:
                 return True, "Premium user - unlimited habits"
 
             if habit_count >= FREE_TIER_LIMIT:
@@ -139,66 +290,125 @@ class SubscriptionService:
         Register a new subscription after payment verification
         """
         try:
-            # Verify transaction first
-            is_valid, message = self.verify_transaction(tx_hash)
-            if not is_valid:
-                raise ValueError(f"Transaction verification failed: {message}")
-
             # Normalize address
             wallet_address = Web3.to_checksum_address(wallet_address)
 
+            # Verify the payment first
+            is_valid, message = self.verify_transaction(tx_hash, wallet_address)
+            if not is_valid:
+                raise ValueError(f"Transaction verification failed: {message}")
+
             subscription, created = Subscription.objects.update_or_create(
                 user_id=user_id,
-                defaults={
-                    "wallet_address": wallet_address,
-                    "tx_hash": tx_hash,
-                    "is_active": True,
-                }
+                defaults=self._subscription_defaults(wallet_address, tx_hash),
             )
 
-            if created:
-                logger.info(f"Created subscription for user {user_id} with wallet {wallet_address}")
-            else:
-                logger.info(f"Updated subscription for user {user_id}")
+            invalidate_entitlement(user_id)
+            self._log_registration(user_id, wallet_address, created)
+            return subscription
+
+        except Exception as e:
+            logger.error(f"Error registering subscription: {e}")
+            raise
+
+    async def aregister_subscription(self, user_id: str, wallet_address: str, tx_hash: str) -> Subscription:
+        """Async ``register_subscription``"""
+        try:
+            wallet_address = Web3.to_checksum_address(wallet_address)
+
+            is_valid, message = await self.averify_transaction(tx_hash, wallet_address)
+            if not is_valid:
+                raise ValueError(f"Transaction verification failed: {message}")
+
+            subscription, created = await Subscription.objects.aupdate_or_create(
+                user_id=user_id,
+                defaults=self._subscription_defaults(wallet_address, tx_hash),
+            )
 
+            await cache.adelete(f"{ENTITLEMENT_CACHE_PREFIX}{user_id}")
+            self._log_registration(user_id, wallet_address, created)
             return subscription
 
         except Exception as e:
             logger.error(f"Error registering subscription: {e}")
             raise
 
+    @staticmethod
+    def _subscription_defaults(wallet_address: str, tx_hash: str) -> dict:
+        return {
+            "wallet_address": wallet_address,
+            "tx_hash": tx_hash.lower(),
+            "is_active": True,
+        }
+
+    @staticmethod
+    def _log_registration(user_id: str, wallet_address: str, created: bool):
+        if created:
+            logger.info(f"Created subscription for user {user_id} with wallet {wallet_address}")
+        else:
+            logger.info(f"Updated subscription for user {user_id}")
+
+    def _encode_call(self, fn_name: str, args) -> dict:
+        data = self.contract.encodeABI(fn_name=fn_name, args=args)  # type: ignore
+        return {"to": self.contract.address, "data": data}  # type: ignore
+
+    def _decode_result(self, fn_name: str, raw):
+        outputs = self.contract.get_function_by_name(fn_name).abi["outputs"]  # type: ignore
+        values = self.contract.w3.codec.decode([o["type"] for o in outputs], raw)  # type: ignore
+        return values[0] if len(values) == 1 else values
+
+    def read_contract(self, fn_name: str, *args):
+        """
+        Call a view function of the subscription contract
+        Results are cached in-process for CONTRACT_READ_TTL seconds
+        """
+        def load():
+            call = self._encode_call(fn_name, args)
+            return self._decode_result(fn_name, self.rpc.call(lambda w3: w3.eth.call(call)))
+
+        return self.contract_reads.get((fn_name, args), load)
+
+    async def aread_contract(self, fn_name: str, *args):
+        """Async ``read_contract``, sharing its cache"""
+        async def load():
+            call = self._encode_call(fn_name, args)
+            return self._decode_result(fn_name, await self.async_rpc.call(lambda w3: w3.eth.call(call)))
+
+        return await self.contract_reads.aget((fn_name, args), load)
+
     def get_subscription_price(self) -> Optional[str]:
         """
         Get current subscription price from contract
         """
-        if not self.is_connected or not CONTRACT_ADDRESS:
+        if self.contract is None:
             return None
 
         try:
-            # Simple ABI for getting price
-            abi = [
-                {
-                    "inputs": [],
-                    "name": "subscriptionPrice",
-                    "outputs": [{"type": "uint256"}],
-                    "stateMutability": "view",
-                    "type": "function"
-                }
-            ]
-
-            contract = self.w3.eth.contract(
-                address=Web3.to_checksum_address(CONTRACT_ADDRESS),
-                abi=abi
-            )
-            price_wei = contract.functions.subscriptionPrice().call()
-            # Convert wei to ether
-            price_eth = self.w3.from_wei(price_wei, 'ether')
-            return str(price_eth)
+            return self._format_price(self.read_contract("subscriptionPrice"))
+        except RpcUnavailable:
+            return None
+        except Exception as e:
+            logger.error(f"Error getting subscription price: {e}")
+            return None
 
+    async def aget_subscription_price(self) -> Optional[str]:
+        """Async ``get_subscription_price``"""
+        if self.contract is None:
+            return None
+
+        try:
+            return self._format_price(await self.aread_contract("subscriptionPrice"))
+        except RpcUnavailable:
+            return None
         except Exception as e:
             logger.error(f"Error getting subscription price: {e}")
             return None
 
+    @staticmethod
+    def _format_price(price_wei) -> str:
+        # Convert wei to ether
+        return str(Web3.from_wei(price_wei, 'ether'))
+
 
 # Singleton instance
 _service = None
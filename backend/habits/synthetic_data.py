@@ -0,0 +1,116 @@
+"""
+Synthetic data - users with habits and years of check-in history for load
+tests and benchmarks
+Check-ins follow streaks and gaps (including occasional multi-week breaks)
+rather than uniform noise, and derived state (streaks, daily counts, XP) is
+built through the same code path as bulk check-ins
+"""
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .checkin_service import BULK_BATCH_SIZE, apply_new_checkins
+from .models import CheckIn, DailyCheckInCount, Habit, LeaderboardEntry, UserStats
+
+DEFAULT_PREFIX = "synthetic-"
+
+# Chance to check in tomorrow after checking in today is drawn per habit from
+# this range; after a missed day the habit is picked up again with RESUME_RATE
+ADHERENCE_RANGE = (0.55, 0.95)
+RESUME_RATE = 0.35
+# Daily chance of a longer break (holiday, illness) and its length in days
+BREAK_RATE = 0.004
+BREAK_DAYS = (7, 30)
+
+HABIT_COLORS = ["#9be9a8", "#40c463", "#30a14e", "#216e39", "#f6c177", "#eb6f92"]
+
+
+def checkin_days(rng: random.Random, start, end, adherence: float):
+    """Dates between ``start`` and ``end`` on which a habit was done"""
+    days = []
+    active = True
+    day = start
+    while day <= end:
+        if rng.random() < BREAK_RATE:
+            day += timedelta(days=rng.randint(*BREAK_DAYS))
+            active = False
+            continue
+        active = rng.random() < (adherence if active else RESUME_RATE)
+        if active:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def clear(prefix: str = DEFAULT_PREFIX, refresh_leaderboard: bool = False) -> None:
+    """Remove every synthetic user's habits, check-ins and derived rows"""
+    with transaction.atomic():
+        Habit.objects.filter(user_id__startswith=prefix).delete()
+        DailyCheckInCount.objects.filter(user_id__startswith=prefix).delete()
+        UserStats.objects.filter(user_id__startswith=prefix).delete()
+    if refresh_leaderboard:
+        LeaderboardEntry.refresh()
+
+
+def generate(
+    users: int,
+    habits_per_user: int,
+    years: float,
+    seed: int = 0,
+    prefix: str = DEFAULT_PREFIX,
+    end=None,
+    refresh_leaderboard: bool = False,
+) -> dict:
+    """
+    Create ``users`` users with ``habits_per_user`` habits each and up to
+    ``years`` of history ending at ``end`` (default today)
+    Habits start at different points in the range. User ids are
+    ``<prefix><n>``; existing synthetic users are not touched
+    The leaderboard snapshot is rebuilt only with ``refresh_leaderboard``
+    (throwaway databases); elsewhere the periodic refresh picks them up
+    Returns counts of what was created
+    """
+    rng = random.Random(seed)
+    end = end or timezone.localdate()
+    span = max(int(365 * years), 1)
+    start = end - timedelta(days=span - 1)
+    existing = UserStats.objects.filter(user_id__startswith=prefix).count()
+
+    checkins = 0
+    for n in range(existing, existing + users):
+        user_id = f"{prefix}{n:06d}"
+        with transaction.atomic():
+            habits = Habit.objects.bulk_create(
+                [
+                    Habit(name=f"Habit {i + 1}", user_id=user_id, color=rng.choice(HABIT_COLORS))
+                    for i in range(habits_per_user)
+                ]
+            )
+            entries = []
+            for habit in habits:
+                first = start + timedelta(days=rng.randint(0, span // 2))
+                adherence = rng.uniform(*ADHERENCE_RANGE)
+                entries += [(habit.pk, d) for d in checkin_days(rng, first, end, adherence)]
+            entries.sort()
+
+            CheckIn.objects.bulk_create(
+                [CheckIn(user_id=user_id, habit_id=habit_id, date=d) for habit_id, d in entries],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            if entries:
+                apply_new_checkins(user_id, habits, entries, display_name=f"Synthetic {n}")
+            else:
+                UserStats.objects.create(user_id=user_id, display_name=f"Synthetic {n}")
+        checkins += len(entries)
+
+    if refresh_leaderboard:
+        LeaderboardEntry.refresh()
+    return {"users": users, "habits": users * habits_per_user, "checkins": checkins}
+
+
+def synthetic_user_ids(prefix: str = DEFAULT_PREFIX):
+    return list(
+        UserStats.objects.filter(user_id__startswith=prefix).order_by("user_id").values_list("user_id", flat=True)
+    )
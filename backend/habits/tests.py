@@ -1,12 +1,17 @@
-from django.test import TestCase
+from django.test import TestCase as DjangoTestCase, override_settings
 from datetime import date, timedelta
 
 from django.utils import timezone
 
-from .models import Habit, CheckIn, get_color_for_count
+from .models import Habit, CheckIn, DailyCheckInCount, LeaderboardEntry, UserStats, get_color_for_count
 
 
-class HabitModelTests(TestCase):
+@override_settings(QUERY_BUDGET_RAISE=True)
+class HabitsTestCase(DjangoTestCase):
+    """Base for these tests: views that go over their query budget fail the test"""
+
+
+class HabitModelTests(HabitsTestCase):
     def test_longest_streak_computation(self):
         h = Habit.objects.create(name="Workout")
         # create checkins: 2026-01-01, 2026-01-02, 2026-01-04, 2026-01-05, 2026-01-06
@@ -18,34 +23,63 @@ class HabitModelTests(TestCase):
 
         self.assertEqual(h.longest_streak(), 3)
 
+    def test_streak_state_updates_incrementally(self):
+        h = Habit.objects.create(name="Read")
+        today = timezone.localdate()
+        for offset in (5, 4, 3, 1, 0):
+            d = today - timedelta(days=offset)
+            CheckIn.objects.create(habit=h, date=d)
+            h.record_checkin_added(d)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(h.current_streak(), 2)
+            self.assertEqual(h.longest_streak(), 3)
+
+        # back-filling the gap merges both runs
+        gap = today - timedelta(days=2)
+        CheckIn.objects.create(habit=h, date=gap)
+        h.record_checkin_added(gap)
+        self.assertEqual((h.current_streak(), h.longest_streak()), (6, 6))
+
+        CheckIn.objects.filter(habit=h, date=today).delete()
+        h.record_checkin_removed(today)
+        self.assertEqual((h.current_streak(), h.longest_streak()), (0, 5))
+
+        fresh = Habit.objects.get(pk=h.pk)
+        fresh.rebuild_streak_state(save=False)
+        self.assertEqual(fresh.last_checkin_date, h.last_checkin_date)
+        self.assertEqual(fresh.longest_run, h.longest_run)
+
+
+class CheckInColorTests(HabitsTestCase):
+    def add(self, habit, day):
+        from .checkin_service import record_checkins
+
+        record_checkins(habit.user_id, [(habit.pk, day)])
+        return CheckIn.objects.get(habit=habit, date=day)
 
-class CheckInColorTests(TestCase):
     def test_color_mapping_by_total_checkins_per_day(self):
-        h1 = Habit.objects.create(name="A")
-        h2 = Habit.objects.create(name="B")
+        habits = [Habit.objects.create(name=name, user_id="u1") for name in "ABCDE"]
         d = date(2026, 2, 1)
 
-        c1 = CheckIn.objects.create(habit=h1, date=d)
+        c1 = self.add(habits[0], d)
         # total = 1 -> #9be9a8
         self.assertEqual(c1.color(), "#9be9a8")
 
-        c2 = CheckIn.objects.create(habit=h2, date=d)
+        c2 = self.add(habits[1], d)
         # total = 2 -> still #9be9a8
         self.assertEqual(c1.color(), "#9be9a8")
         self.assertEqual(c2.color(), "#9be9a8")
 
         # add two more checkins (different habits allowed)
-        h3 = Habit.objects.create(name="C")
-        h4 = Habit.objects.create(name="D")
-        c3 = CheckIn.objects.create(habit=h3, date=d)
-        c4 = CheckIn.objects.create(habit=h4, date=d)
+        self.add(habits[2], d)
+        c4 = self.add(habits[3], d)
         # total = 4 -> #40c463
         self.assertEqual(c1.color(), "#40c463")
         self.assertEqual(c4.color(), "#40c463")
 
         # add one more to reach 5
-        h5 = Habit.objects.create(name="E")
-        c5 = CheckIn.objects.create(habit=h5, date=d)
+        c5 = self.add(habits[4], d)
         self.assertEqual(c5.color(), "#216e39")
         self.assertEqual(c1.color(), "#216e39")
 
@@ -58,21 +92,36 @@ class CheckInColorTests(TestCase):
         self.assertEqual(get_color_for_count(4), "#40c463")
         self.assertEqual(get_color_for_count(5), "#216e39")
 
-        # classmethod should reflect aggregated counts for a date
-        h1 = Habit.objects.create(name="X")
-        h2 = Habit.objects.create(name="Y")
+        # classmethod reflects the user's own count for a date
         d = date(2026, 3, 3)
-        CheckIn.objects.create(habit=h1, date=d)
-        self.assertEqual(CheckIn.color_for_date(d), "#9be9a8") 
-        CheckIn.objects.create(habit=h2, date=d)
-        self.assertEqual(CheckIn.color_for_date(d), "#9be9a8")
-        # add more to push into other buckets
-        for i in range(3):
-            h = Habit.objects.create(name=f"Z{i}")
-            CheckIn.objects.create(habit=h, date=d)
-        self.assertEqual(CheckIn.color_for_date(d), "#216e39")
+        for i in range(5):
+            self.add(Habit.objects.create(name=f"Z{i}", user_id="u1"), d)
+        self.add(Habit.objects.create(name="Other", user_id="u2"), d)
+        self.assertEqual(CheckIn.color_for_date("u1", d), "#216e39")
+        self.assertEqual(CheckIn.color_for_date("u2", d), "#9be9a8")
+        self.assertEqual(CheckIn.color_for_date("u3", d), "#ebedf0")
 
-class ApiEndpointTests(TestCase):
+    def test_admin_writes_keep_derived_state(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+
+        admin = site._registry[CheckIn]
+        request = RequestFactory().post("/")
+        habit = Habit.objects.create(name="Admin", user_id="u1")
+        d = date(2026, 4, 1)
+
+        checkin = CheckIn(habit=habit, date=d)
+        admin.save_model(request, checkin, None, False)
+        habit.refresh_from_db()
+        self.assertEqual((checkin.user_id, habit.last_checkin_date), ("u1", d))
+        self.assertEqual(CheckIn.count_for_date("u1", d), 1)
+
+        admin.delete_queryset(request, CheckIn.objects.filter(pk=checkin.pk))
+        habit.refresh_from_db()
+        self.assertEqual((CheckIn.count_for_date("u1", d), habit.last_checkin_date), (0, None))
+
+
+class ApiEndpointTests(HabitsTestCase):
     def setUp(self):
         from rest_framework.test import APIClient
 
@@ -130,8 +179,1448 @@ class ApiEndpointTests(TestCase):
         self.assertIn("weekly", payload)
         self.assertIn("monthly", payload)
 
+    def test_checkin_create_and_delete_maintain_streak_state(self):
+        from config.firebase_auth import FirebaseUser
+
+        self.client.force_authenticate(user=FirebaseUser(uid="u1"))
+        h = Habit.objects.create(name="Walk", user_id="u1")
+        today = timezone.localdate()
+        for d in (today - timedelta(days=1), today):
+            resp = self.client.post("/api/checkins/", {"habit": h.id, "date": d.isoformat()})  # type: ignore
+            self.assertEqual(resp.status_code, 201)
+
+        h.refresh_from_db()
+        self.assertEqual((h.current_run_start, h.last_checkin_date, h.longest_run), (today - timedelta(days=1), today, 2))
+
+        checkin = CheckIn.objects.get(habit=h, date=today)
+        resp = self.client.delete(f"/api/checkins/{checkin.id}/")  # type: ignore
+        self.assertEqual(resp.status_code, 204)
+        h.refresh_from_db()
+        self.assertEqual(h.last_checkin_date, today - timedelta(days=1))
+        self.assertEqual(h.longest_run, 1)
+
+    def test_habit_list_query_count_is_constant(self):
+        from config.firebase_auth import FirebaseUser
+
+        self.client.force_authenticate(user=FirebaseUser(uid="u1"))
+        today = timezone.localdate()
+        for i in range(8):
+            h = Habit.objects.create(name=f"H{i}", user_id="u1")
+            for offset in range(i):
+                CheckIn.objects.create(habit=h, user_id="u1", date=today - timedelta(days=offset))
+
+        # data version + list + check-in dates + bulk update of the built streak state
+        with self.assertNumQueries(4):
+            resp = self.client.get("/api/habits/")
+        self.assertEqual(resp.status_code, 200)
+        streaks = {item["name"]: (item["current_streak"], item["longest_streak"]) for item in resp.json()}
+        self.assertEqual(streaks["H0"], (0, 0))
+        self.assertEqual(streaks["H7"], (7, 7))
+
+        # once the state exists only the version lookup and the list remain
+        with self.assertNumQueries(2):
+            self.client.get("/api/habits/")
+
+    def test_conditional_get_returns_304_until_data_changes(self):
+        from config.firebase_auth import FirebaseUser
+
+        self.client.force_authenticate(user=FirebaseUser(uid="u1"))
+        h = Habit.objects.create(name="Etag", user_id="u1")
+        params = {"from": "2026-02-01", "to": "2026-02-28"}
+
+        first = self.client.get("/api/heatmap/", params)
+        etag = first["ETag"]
+        self.assertIn("Authorization", first["Vary"])
+
+        # revalidation only reads the user's data version
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/heatmap/", params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        # a different query string is a different representation
+        resp = self.client.get("/api/heatmap/", {"from": "2026-02-01", "to": "2026-02-27"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+        self.client.post("/api/checkins/", {"habit": h.id, "date": "2026-02-03"})  # type: ignore
+        resp = self.client.get("/api/heatmap/", params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+        habits_etag = self.client.get("/api/habits/")["ETag"]
+        self.client.patch(f"/api/habits/{h.id}/", {"name": "Renamed"})  # type: ignore
+        resp = self.client.get("/api/habits/", HTTP_IF_NONE_MATCH=habits_etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_heatmap_compact_encoding_spans_years(self):
+        import base64
+        import json
+        from config.firebase_auth import FirebaseUser
+
+        self.client.force_authenticate(user=FirebaseUser(uid="u1"))
+        DailyCheckInCount.objects.create(user_id="u1", date=date(2024, 12, 31), count=1)
+        DailyCheckInCount.objects.create(user_id="u1", date=date(2025, 1, 2), count=3)
+
+        resp = self.client.get(
+            "/api/heatmap/", {"from": "2024-12-30", "to": "2026-01-01", "encoding": "compact"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        payload = json.loads(b"".join(resp.streaming_content))  # type: ignore
+        self.assertEqual(payload["from"], "2024-12-30")
+        chunks = payload["chunks"]
+        self.assertEqual([(c["start"], c["days"]) for c in chunks], [("2024-12-30", 2), ("2025-01-01", 365), ("2026-01-01", 1)])
+
+        self.assertEqual(chunks[0]["encoding"], "bitset")
+        self.assertEqual(base64.b64decode(chunks[0]["data"]), bytes([0b10]))
+        self.assertEqual(chunks[1]["encoding"], "counts")
+        self.assertEqual(list(base64.b64decode(chunks[1]["data"])[:3]), [0, 3, 0])
+        self.assertLess(len(chunks[1]["data"]), 500)
+
     def test_missing_parameters_and_errors(self):
         resp = self.client.get("/api/heatmap/")
         self.assertEqual(resp.status_code, 400)
         resp = self.client.get("/api/stats/", {"habit_id": 9999})
         self.assertEqual(resp.status_code, 404)
+
+
+class DailyCheckInCountTests(HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=FirebaseUser(uid="u1"))
+        self.day = date(2026, 4, 1)
+        self.habits = [Habit.objects.create(name=f"R{i}", user_id="u1") for i in range(3)]
+
+    def counts(self):
+        return dict(DailyCheckInCount.objects.filter(user_id="u1").values_list("date", "count"))
+
+    def test_rollup_follows_checkin_create_and_delete(self):
+        for h in self.habits:
+            self.client.post("/api/checkins/", {"habit": h.id, "date": self.day.isoformat()})  # type: ignore
+        # another user's check-in on the same day does not affect u1's colors
+        other = Habit.objects.create(name="Other", user_id="u2")
+        CheckIn.objects.create(habit=other, user_id="u2", date=self.day)
+        self.assertEqual(self.counts(), {self.day: 3})
+
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/checkins/")
+        self.assertEqual({item["color"] for item in resp.json()["results"]}, {get_color_for_count(3)})
+
+        checkin = CheckIn.objects.filter(habit=self.habits[0]).get()
+        self.client.delete(f"/api/checkins/{checkin.id}/")  # type: ignore
+        self.assertEqual(self.counts(), {self.day: 2})
+
+        self.client.delete(f"/api/habits/{self.habits[1].id}/")  # type: ignore
+        self.client.delete(f"/api/habits/{self.habits[2].id}/")  # type: ignore
+        self.assertEqual(self.counts(), {})
+
+    def test_checkins_are_keyset_paginated_and_filtered(self):
+        for offset in range(5):
+            day = self.day + timedelta(days=offset)
+            for h in self.habits[:2]:
+                CheckIn.objects.create(habit=h, user_id="u1", date=day)
+
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            # data version (ETag), one page, its daily counts
+            with self.assertNumQueries(3):
+                payload = self.client.get("/api/checkins/", params).json()
+            seen += [(item["date"], item["id"]) for item in payload["results"]]
+            cursor = payload["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+        payload = self.client.get(
+            "/api/checkins/",
+            {"from": "2026-04-02", "to": "2026-04-03", "habit": self.habits[0].id},  # type: ignore
+        ).json()
+        self.assertEqual([item["date"] for item in payload["results"]], ["2026-04-03", "2026-04-02"])
+        self.assertEqual(self.client.get("/api/checkins/", {"cursor": "bogus"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/checkins/", {"cursor": "2026-02-30.1"}).status_code, 400)
+        resp = self.client.get("/api/checkins/", {"from": "2026-02-30"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["detail"], "from and to must be dates (YYYY-MM-DD)")
+
+    def test_heatmap_and_stats_read_rollup(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        for i, h in enumerate(self.habits):
+            CheckIn.objects.create(habit=h, user_id="u1", date=self.day)
+            CheckIn.objects.create(habit=h, user_id="u1", date=self.day + timedelta(days=i + 1))
+        call_command("rebuild_daily_counts", stdout=StringIO())
+
+        resp = self.client.get("/api/heatmap/", {"from": "2026-04-01", "to": "2026-04-04"})
+        self.assertEqual([item["count"] for item in resp.json()], [3, 1, 1, 1])
+
+        resp = self.client.get("/api/stats/")
+        payload = resp.json()
+        self.assertEqual(payload["total_completed"], 6)
+        self.assertEqual(sum(b["count"] for b in payload["monthly"]), 6)
+
+    def test_stats_granularity_and_range(self):
+        for i, h in enumerate(self.habits):
+            DailyCheckInCount.objects.create(user_id="u1", date=date(2025, 3 * i + 1, 15), count=i + 1)
+        DailyCheckInCount.objects.create(user_id="u1", date=date(2024, 12, 30), count=2)
+
+        # stats version lookup, total, habits count and one bucket query
+        with self.assertNumQueries(4):
+            resp = self.client.get("/api/stats/", {"granularity": "quarter", "from": "2025-01-01"})
+        payload = resp.json()
+        self.assertNotIn("weekly", payload)
+        self.assertEqual(
+            payload["buckets"],
+            [
+                {"start": "2025-01-01", "count": 1},
+                {"start": "2025-04-01", "count": 2},
+                {"start": "2025-07-01", "count": 3},
+            ],
+        )
+
+        # ISO week buckets start on Monday, even across the year boundary
+        resp = self.client.get("/api/stats/", {"to": "2024-12-31"})
+        self.assertEqual(resp.json()["weekly"], [{"week_start": "2024-12-30", "count": 2}])
+
+        resp = self.client.get("/api/stats/", {"granularity": "fortnight"})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get("/api/stats/", {"granularity": "week", "from": "2026-02-30"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class StubFirebaseAuth:
+    """Local stand-in for ``firebase_admin.auth`` used by the display name resolver."""
+
+    class UidIdentifier:
+        def __init__(self, uid):
+            self.uid = uid
+
+    class UserRecord:
+        def __init__(self, uid, display_name=None, email=None):
+            self.uid = uid
+            self.display_name = display_name
+            self.email = email
+
+    class GetUsersResult:
+        def __init__(self, users, not_found):
+            self.users = users
+            self.not_found = not_found
+
+    def __init__(self, records):
+        self.records = {r.uid: r for r in records}
+        self.calls = []
+
+    def get_users(self, identifiers):
+        self.calls.append([i.uid for i in identifiers])
+        users = [self.records[i.uid] for i in identifiers if i.uid in self.records]
+        not_found = [i for i in identifiers if i.uid not in self.records]
+        return self.GetUsersResult(users, not_found)
+
+
+class LeaderboardDisplayNameTests(HabitsTestCase):
+    def setUp(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from . import display_names
+
+        cache.clear()
+        self.client = APIClient()
+        self.firebase = StubFirebaseAuth(
+            [
+                StubFirebaseAuth.UserRecord("alice-uid", display_name="Alice"),
+                StubFirebaseAuth.UserRecord("bob-uid", email="bob@example.com"),
+                StubFirebaseAuth.UserRecord("nameless-uid"),
+            ]
+        )
+        for patcher in (
+            mock.patch.object(display_names, "firebase_auth", self.firebase),
+            # resolve queued users explicitly with display_names.flush()
+            mock.patch.object(display_names, "_ensure_worker"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.flush = display_names.flush
+
+        for i, uid in enumerate(["alice-uid", "bob-uid", "nameless-uid", "ghost-uid"]):
+            UserStats.objects.create(user_id=uid, xp_total=100 - i)
+
+    def names(self):
+        resp = self.client.get("/api/leaderboard/")
+        return [r["display_name"] for r in resp.json()["results"]]
+
+    def test_leaderboard_resolves_names_in_background_batches(self):
+        self.assertEqual(self.names(), ["User alice-...", "User bob-ui...", "User namele...", "User ghost-..."])
+        self.assertEqual(self.firebase.calls, [])
+
+        self.flush()
+        self.assertEqual(len(self.firebase.calls), 1)
+        self.assertCountEqual(self.firebase.calls[0], ["alice-uid", "bob-uid", "nameless-uid", "ghost-uid"])
+        self.assertEqual(UserStats.objects.get(user_id="bob-uid").display_name, "bob")
+
+        # names are stored, users without one are negatively cached
+        self.assertEqual(self.names(), ["Alice", "bob", "User namele...", "User ghost-..."])
+        self.flush()
+        self.assertEqual(len(self.firebase.calls), 1)
+
+
+class LeaderboardSnapshotTests(HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.client = APIClient()
+        for i in range(7):
+            UserStats.objects.create(user_id=f"user{i}", display_name=f"U{i}", xp_total=(7 - i) * 100)
+        LeaderboardEntry.refresh(batch_size=3)
+
+    def test_cursor_pagination_walks_the_snapshot(self):
+        seen = []
+        cursor = 0
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                payload = self.client.get("/api/leaderboard/", {"limit": 3, "cursor": cursor}).json()
+            seen += [(r["position"], r["user_id"]) for r in payload["results"]]
+            cursor = payload["next_cursor"]
+        self.assertEqual(seen, [(i + 1, f"user{i}") for i in range(7)])
+
+    def test_my_position_and_neighbors(self):
+        from config.firebase_auth import FirebaseUser
+
+        self.client.force_authenticate(user=FirebaseUser(uid="user3"))
+        payload = self.client.get("/api/leaderboard/me/", {"neighbors": 1}).json()
+        self.assertEqual((payload["position"], payload["estimated"]), (4, False))
+        self.assertEqual([r["user_id"] for r in payload["neighbors"]], ["user2", "user3", "user4"])
+
+        # users who joined after the refresh get an estimated slot
+        UserStats.objects.create(user_id="newbie", xp_total=350)
+        self.client.force_authenticate(user=FirebaseUser(uid="newbie"))
+        payload = self.client.get("/api/leaderboard/me/").json()
+        self.assertEqual((payload["position"], payload["estimated"]), (5, True))
+
+    def test_stale_snapshot_falls_back_to_live_ranking(self):
+        from django.test import override_settings
+        from config.firebase_auth import FirebaseUser
+
+        UserStats.objects.filter(user_id="user6").update(xp_total=1000)
+        payload = self.client.get("/api/leaderboard/", {"limit": 1}).json()
+        self.assertEqual(payload["results"][0]["user_id"], "user0")
+        self.assertIsNotNone(payload["refreshed_at"])
+
+        with override_settings(LEADERBOARD_MAX_AGE=0):
+            payload = self.client.get("/api/leaderboard/", {"limit": 1}).json()
+            self.assertEqual(payload["results"][0]["user_id"], "user6")
+            self.assertIsNone(payload["refreshed_at"])
+
+            self.client.force_authenticate(user=FirebaseUser(uid="user6"))
+            payload = self.client.get("/api/leaderboard/me/", {"neighbors": 1}).json()
+            self.assertEqual((payload["position"], payload["estimated"]), (1, False))
+            self.assertEqual([r["user_id"] for r in payload["neighbors"]], ["user6", "user0"])
+
+
+class CheckInXpAwardTests(HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=FirebaseUser(uid="u1", name="Una"))
+        self.today = timezone.localdate()
+
+    def post(self, habit, day):
+        return self.client.post("/api/checkins/", {"habit": habit.id, "date": day.isoformat()})
+
+    def test_streak_milestone_bonus_and_single_award(self):
+        h = Habit.objects.create(name="Run", user_id="u1")
+        for offset in range(4, -1, -1):
+            self.assertEqual(self.post(h, self.today - timedelta(days=offset)).status_code, 201)
+        stats = UserStats.objects.get(user_id="u1")
+        # four base awards plus the 5-day milestone
+        self.assertEqual(stats.xp_total, 4 * 10 + 10 + 20)
+        self.assertEqual(stats.display_name, "Una")
+
+        # re-checking in after a delete does not award XP twice
+        checkin = CheckIn.objects.get(habit=h, date=self.today)
+        self.client.delete(f"/api/checkins/{checkin.id}/")  # type: ignore
+        self.post(h, self.today)
+        self.assertEqual(UserStats.objects.get(user_id="u1").xp_total, 70)
+
+        self.assertEqual(self.post(h, self.today).status_code, 400)
+
+    def test_query_count_does_not_grow_with_history(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        short = Habit.objects.create(name="Short", user_id="u1")
+        long = Habit.objects.create(name="Long", user_id="u1")
+        for offset in range(1, 120):
+            self.post(long, self.today - timedelta(days=offset))
+        self.post(short, self.today - timedelta(days=1))
+        # today's daily count row already exists for both measured posts
+        self.post(Habit.objects.create(name="Warm", user_id="u1"), self.today)
+
+        counts = []
+        for habit in (short, long):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.post(habit, self.today).status_code, 201)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 13)
+
+    def test_bulk_checkins_replay_offline_history(self):
+        a = Habit.objects.create(name="A", user_id="u1")
+        b = Habit.objects.create(name="B", user_id="u1")
+        self.post(a, self.today - timedelta(days=5))
+        start = self.today - timedelta(days=29)
+        checkins = [
+            {"habit": h.id, "date": (start + timedelta(days=i)).isoformat()}  # type: ignore
+            for h in (a, b)
+            for i in range(30)
+        ]
+
+        with self.assertNumQueries(15):
+            resp = self.client.post("/api/checkins/bulk/", {"checkins": checkins}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        payload = resp.json()
+        self.assertEqual((payload["created"], payload["skipped"]), (59, 1))
+        # 59 base awards plus milestones at 5, 10 and 20 days for both habits
+        self.assertEqual(payload["xp_awarded"], 59 * 10 + 2 * (20 + 40 + 80))
+
+        a.refresh_from_db()
+        self.assertEqual((a.current_streak(), a.longest_streak()), (30, 30))
+        self.assertEqual(DailyCheckInCount.objects.get(user_id="u1", date=self.today).count, 2)
+        self.assertEqual(UserStats.objects.get(user_id="u1").xp_total, 10 + payload["xp_awarded"])
+
+        other = Habit.objects.create(name="Theirs", user_id="u2")
+        resp = self.client.post(
+            "/api/checkins/bulk/",
+            {"checkins": [{"habit": other.id, "date": self.today.isoformat()}]},  # type: ignore
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(CheckIn.objects.filter(habit=other).exists())
+
+    def test_single_and_bulk_replays_award_the_same_xp(self):
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+
+        # offline history well in the past: runs of 12 and 6 days around a gap
+        start = self.today - timedelta(days=60)
+        days = [start + timedelta(days=i) for i in range(20) if i != 12]
+
+        one_by_one = Habit.objects.create(name="Single", user_id="u1")
+        for day in days:
+            self.assertEqual(self.post(one_by_one, day).status_code, 201)
+
+        bulk_client = APIClient()
+        bulk_client.force_authenticate(user=FirebaseUser(uid="u2"))
+        bulk = Habit.objects.create(name="Bulk", user_id="u2")
+        checkins = [{"habit": bulk.id, "date": day.isoformat()} for day in days]  # type: ignore
+        bulk_client.post("/api/checkins/bulk/", {"checkins": checkins}, format="json")
+
+        single_xp = UserStats.objects.get(user_id="u1").xp_total
+        self.assertEqual(single_xp, UserStats.objects.get(user_id="u2").xp_total)
+        # 19 base awards, milestones at 5 and 10 in the first run, 5 in the second
+        self.assertEqual(single_xp, 19 * 10 + 20 + 40 + 20)
+
+        # a back-filled day counts the run that ends on it
+        late = Habit.objects.create(name="Late", user_id="u1")
+        for offset in (0, 1, 2, 3, 5):
+            self.post(late, start + timedelta(days=offset))
+        before = UserStats.objects.get(user_id="u1").xp_total
+        self.post(late, start + timedelta(days=4))
+        self.assertEqual(UserStats.objects.get(user_id="u1").xp_total - before, 10 + 20)
+
+
+class FirebaseTokenCacheTests(HabitsTestCase):
+    def setUp(self):
+        from unittest import mock
+        from config import firebase_auth
+
+        self.firebase_auth = firebase_auth
+        firebase_auth.token_cache.clear()
+        self.addCleanup(firebase_auth.token_cache.clear)
+        patcher = mock.patch.object(firebase_auth, "verify_id_token")
+        self.verify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def authenticate(self, token):
+        from rest_framework.test import APIRequestFactory
+
+        request = APIRequestFactory().get("/api/xp/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.firebase_auth.FirebaseAuthentication().authenticate(request)
+
+    def test_repeat_tokens_skip_verification_until_expiry(self):
+        import time
+
+        self.verify.return_value = {"uid": "u1", "exp": time.time() + 3600}
+        for _ in range(3):
+            user, _ = self.authenticate("token-a")
+            self.assertEqual(user.uid, "u1")
+        self.assertEqual(self.verify.call_count, 1)
+
+        self.verify.return_value = {"uid": "u2", "exp": time.time() - 1}
+        self.authenticate("token-b")
+        self.authenticate("token-b")
+        self.assertEqual(self.verify.call_count, 3)
+
+    def test_cache_is_bounded_lru(self):
+        import time
+
+        cache = self.firebase_auth.TokenCache(maxsize=2)
+        exp = time.time() + 60
+        cache.set("a", {"uid": "a", "exp": exp})
+        cache.set("b", {"uid": "b", "exp": exp})
+        cache.get("a")
+        cache.set("c", {"uid": "c", "exp": exp})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a")["uid"], "a")  # type: ignore
+
+
+class SignedTokenMixin:
+    """Verifies ID tokens against a local key set so tests can mint real tokens"""
+
+    def use_signed_tokens(self):
+        from unittest import mock
+
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        from config import firebase_auth
+
+        self.firebase_auth = firebase_auth
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_pem = (
+            self.private_key.public_key()
+            .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            .decode()
+        )
+        firebase_auth.signing_keys.set_local_keys({"test-kid": public_pem})
+        self.addCleanup(firebase_auth.signing_keys.reset)
+        firebase_auth.token_cache.clear()
+        self.addCleanup(firebase_auth.token_cache.clear)
+        patcher = mock.patch.object(firebase_auth, "PROJECT_ID", "demo-project")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mint(self, uid="u1", kid="test-kid", **overrides):
+        import time
+
+        import jwt
+
+        now = int(time.time())
+        claims = {
+            "iss": "https://securetoken.google.com/demo-project",
+            "aud": "demo-project",
+            "sub": uid,
+            "iat": now,
+            "exp": now + 3600,
+            "email": f"{uid}@example.com",
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class LocalTokenVerificationTests(SignedTokenMixin, HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.client = APIClient()
+        self.use_signed_tokens()
+
+    def test_locally_signed_token_authenticates_without_network(self):
+        from unittest import mock
+
+        with mock.patch.object(self.firebase_auth.requests, "get") as get:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.mint('local-user')}")
+            resp = self.client.get("/api/xp/")
+        self.assertEqual(resp.status_code, 200)
+        get.assert_not_called()
+
+    def test_invalid_tokens_are_rejected(self):
+        import time
+
+        bad_tokens = [
+            self.mint(aud="other-project"),
+            self.mint(exp=int(time.time()) - 3600),
+            # no leeway past exp by default, as with the Admin SDK
+            self.mint(exp=int(time.time()) - 5),
+            self.mint(kid="unknown-kid"),
+            self.mint(sub=""),
+        ]
+        for token in bad_tokens:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertIn(self.client.get("/api/xp/").status_code, (401, 403))
+
+    def google_keys_response(self):
+        from unittest import mock
+
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.x509.oid import NameOID
+        import datetime
+
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(1)
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        response = mock.Mock(headers={"Cache-Control": "public, max-age=20000, must-revalidate"})
+        response.json.return_value = {"google-kid": cert.public_bytes(serialization.Encoding.PEM).decode()}
+        return response
+
+    def test_google_keys_are_cached_for_max_age(self):
+        from unittest import mock
+
+        response = self.google_keys_response()
+        keys = self.firebase_auth.SigningKeyCache("https://example.invalid/certs")
+        with mock.patch.object(self.firebase_auth.requests, "get", return_value=response) as get:
+            self.assertIsNotNone(keys.get("google-kid"))
+            self.assertIsNotNone(keys.get("google-kid"))
+        self.assertEqual(get.call_count, 1)
+        import time
+
+        self.assertGreater(keys._expires_at, time.time() + 19000)
+
+    def test_cold_cache_fetches_keys_once_for_concurrent_requests(self):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+
+        response = self.google_keys_response()
+
+        def slow_get(*args, **kwargs):
+            time.sleep(0.1)
+            return response
+
+        keys = self.firebase_auth.SigningKeyCache("https://example.invalid/certs")
+        with mock.patch.object(self.firebase_auth.requests, "get", side_effect=slow_get) as get:
+            with ThreadPoolExecutor(8) as pool:
+                found = list(pool.map(keys.get, ["google-kid"] * 8))
+        self.assertTrue(all(key is not None for key in found))
+        self.assertEqual(get.call_count, 1)
+
+
+class HangingRpcNodeMixin:
+    """A local node that accepts connections and never answers"""
+
+    def start_hanging_node(self):
+        import socket
+        import threading
+
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(16)
+        self.node_connections = []
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                self.node_connections.append(conn)
+
+        threading.Thread(target=accept, daemon=True).start()
+
+        def stop():
+            server.close()
+            for conn in self.node_connections:
+                conn.close()
+
+        self.addCleanup(stop)
+        return f"http://127.0.0.1:{server.getsockname()[1]}"
+
+
+class RpcClientTests(HangingRpcNodeMixin, HabitsTestCase):
+    def test_hedged_call_returns_first_answer(self):
+        import time
+
+        from .rpc_client import RpcClient
+
+        client = RpcClient(["http://slow.invalid", "http://fast.invalid"], hedge_delay=0.05)
+
+        def block_number(w3):
+            if "slow" in w3.provider.endpoint_uri:
+                time.sleep(1)
+                return 1
+            return 2
+
+        started = time.monotonic()
+        self.assertEqual(client.call(block_number), 2)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        import requests
+
+        from .rpc_client import BREAKER_FAILURE_THRESHOLD, RpcClient, RpcUnavailable
+
+        client = RpcClient(["http://down.invalid"])
+        calls = []
+
+        def failing(w3):
+            calls.append(1)
+            raise requests.ConnectionError("connection refused")
+
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            with self.assertRaises(RpcUnavailable):
+                client.call(failing)
+        self.assertFalse(client.available)
+
+        with self.assertRaises(RpcUnavailable):
+            client.call(failing)
+        self.assertEqual(len(calls), BREAKER_FAILURE_THRESHOLD)
+
+    def test_half_open_trial_is_not_spent_on_an_untried_endpoint(self):
+        import time
+        from unittest import mock
+
+        from .rpc_client import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, RpcClient
+
+        client = RpcClient(["http://primary.invalid", "http://recovering.invalid"], hedge_delay=0)
+        recovering = client.endpoints[1].breaker
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            recovering.record_failure()
+
+        later = time.monotonic() + BREAKER_RESET_TIMEOUT + 1
+        with mock.patch("habits.rpc_client.time.monotonic", return_value=later):
+            # the primary answers, so the recovering endpoint is never called
+            self.assertEqual(client.call(lambda w3: 1), 1)
+            self.assertTrue(recovering.allow())
+
+    def test_hanging_node_costs_one_timeout(self):
+        import time
+        from unittest import mock
+
+        from .rpc_client import RpcClient, RpcUnavailable
+
+        url = self.start_hanging_node()
+        with mock.patch("habits.rpc_client.RPC_CONNECT_TIMEOUT", 0.5), mock.patch(
+            "habits.rpc_client.RPC_READ_TIMEOUT", 0.5
+        ):
+            client = RpcClient([url])
+
+        started = time.monotonic()
+        with self.assertRaises(RpcUnavailable):
+            client.call(lambda w3: w3.eth.block_number)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(self.node_connections), 1)
+
+    def test_verify_transaction_fails_fast_when_unavailable(self):
+        from unittest import mock
+
+        from .rpc_client import RpcUnavailable
+        from .subscription_service import SubscriptionService
+
+        rpc = mock.Mock()
+        rpc.call.side_effect = RpcUnavailable("All RPC endpoints are unavailable")
+        self.assertEqual(
+            SubscriptionService(rpc=rpc).verify_transaction("0xabc"),
+            (False, "Blockchain service unavailable"),
+        )
+
+
+class EntitlementCacheTests(SignedTokenMixin, HabitsTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+
+        cache.clear()
+        self.use_signed_tokens()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.mint('u1')}")
+
+    def test_limit_checks_are_served_from_cache(self):
+        from .subscription_service import FREE_TIER_LIMIT
+
+        for i in range(FREE_TIER_LIMIT):
+            self.assertEqual(self.client.post("/api/habits/", {"name": f"H{i}"}).status_code, 201)
+
+        self.client.get("/api/subscriptions/can-create-habit/")
+        with self.assertNumQueries(0):
+            resp = self.client.get("/api/subscriptions/can-create-habit/")
+            status = self.client.get("/api/subscriptions/status/")
+        self.assertEqual(status.json()["is_premium"], False)
+        self.assertFalse(resp.json()["can_create"])
+        self.assertEqual(resp.json()["current_habits"], FREE_TIER_LIMIT)
+        self.assertEqual(self.client.post("/api/habits/", {"name": "extra"}).status_code, 400)
+
+        habit_id = Habit.objects.filter(user_id="u1").first().id  # type: ignore
+        self.client.delete(f"/api/habits/{habit_id}/")
+        resp = self.client.get("/api/subscriptions/can-create-habit/")
+        self.assertTrue(resp.json()["can_create"])
+
+    def test_registration_invalidates_entitlement(self):
+        from unittest import mock
+
+        from .subscription_service import SubscriptionService
+
+        self.assertFalse(self.client.get("/api/subscriptions/status/").json()["is_premium"])
+        with mock.patch.object(SubscriptionService, "averify_transaction", return_value=(True, "ok")):
+            resp = self.client.post(
+                "/api/subscriptions/register/",
+                {"wallet_address": "0x" + "11" * 20, "tx_hash": "0x" + "ab" * 32},
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 201)
+        self.assertTrue(self.client.get("/api/subscriptions/status/").json()["is_premium"])
+
+    def test_workers_with_process_local_caches(self):
+        import time
+        from unittest import mock
+
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from .subscription_service import ENTITLEMENT_LOCAL_CACHE_TTL, FREE_TIER_LIMIT, SubscriptionService
+
+        # two worker processes, each with its own LocMemCache
+        worker_a = LocMemCache("worker-a", {})
+        worker_b = LocMemCache("worker-b", {})
+
+        def on(worker):
+            return mock.patch("habits.subscription_service.cache", worker)
+
+        with on(worker_b):
+            self.assertFalse(self.client.get("/api/subscriptions/status/").json()["is_premium"])
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.post("/api/habits/", {"name": "B0"}).status_code, 201)
+            # with a warm cache the limit check reads no subscription
+            self.assertFalse([q for q in ctx.captured_queries if "habits_subscription" in q["sql"]])
+            for i in range(1, FREE_TIER_LIMIT - 1):
+                self.assertEqual(self.client.post("/api/habits/", {"name": f"B{i}"}).status_code, 201)
+        with on(worker_a):
+            self.assertEqual(self.client.post("/api/habits/", {"name": "A"}).status_code, 201)
+        with on(worker_b):
+            # B's cached count is one behind only until the short TTL runs out
+            later = time.time() + ENTITLEMENT_LOCAL_CACHE_TTL + 1
+            with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+                self.assertEqual(self.client.post("/api/habits/", {"name": "extra"}).status_code, 400)
+            # steady-state checks are served from the cache
+            with self.assertNumQueries(0):
+                self.client.get("/api/subscriptions/can-create-habit/")
+
+        with on(worker_a), mock.patch.object(
+            SubscriptionService, "averify_transaction", return_value=(True, "ok")
+        ):
+            self.client.post(
+                "/api/subscriptions/register/",
+                {"wallet_address": "0x" + "11" * 20, "tx_hash": "0x" + "ab" * 32},
+                format="json",
+            )
+        with on(worker_b):
+            # B's cached entitlement denies; the denial is rechecked against the database
+            self.assertEqual(self.client.post("/api/habits/", {"name": "premium"}).status_code, 201)
+            # B's stale status expires within the short TTL
+            later = time.time() + ENTITLEMENT_LOCAL_CACHE_TTL + 1
+            with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+                self.assertTrue(self.client.get("/api/subscriptions/status/").json()["is_premium"])
+
+
+class SubscriptionIndexerTests(HabitsTestCase):
+    contract = "0x" + "22" * 20
+    buyer = "0x" + "33" * 20
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def purchase_log(self, tx_byte, block, log_index=0, buyer=None):
+        from eth_abi import encode
+        from hexbytes import HexBytes
+        from web3 import Web3
+
+        from .subscription_indexer import SUBSCRIPTION_PURCHASED_TOPIC
+
+        buyer = buyer or self.buyer
+        return {
+            "address": Web3.to_checksum_address(self.contract),
+            "topics": [HexBytes(SUBSCRIPTION_PURCHASED_TOPIC), HexBytes(bytes(12) + HexBytes(buyer))],
+            "data": HexBytes(encode(["uint256", "uint256"], [5 * 10**15, 1_760_000_000])),
+            "blockNumber": block,
+            "blockHash": HexBytes(bytes(32)),
+            "transactionHash": HexBytes(bytes([tx_byte]) * 32),
+            "transactionIndex": 0,
+            "logIndex": log_index,
+        }
+
+    def fake_rpc(self, logs, head):
+        from unittest import mock
+
+        w3 = mock.Mock()
+        w3.eth.block_number = head
+        w3.eth.get_logs.side_effect = lambda params: [
+            log for log in logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]
+        ]
+        rpc = mock.Mock()
+        rpc.call.side_effect = lambda fn: fn(w3)
+        return rpc, w3
+
+    def test_sync_indexes_ranges_and_checkpoints(self):
+        from unittest import mock
+
+        from . import subscription_indexer
+        from .models import IndexerCheckpoint, SubscriptionPayment
+
+        logs = [self.purchase_log(1, 5), self.purchase_log(2, 2500)]
+        rpc, w3 = self.fake_rpc(logs, head=3000)
+        with mock.patch.object(subscription_indexer, "BLOCK_RANGE", 1000):
+            self.assertEqual(subscription_indexer.sync(rpc, self.contract), (0, 2998, 2))
+            self.assertEqual(w3.eth.get_logs.call_count, 3)
+            self.assertEqual(SubscriptionPayment.objects.count(), 2)
+            self.assertEqual(IndexerCheckpoint.objects.get().block_number, 2998)
+
+            # resumes after the checkpoint, re-indexing is idempotent
+            w3.eth.block_number = 3100
+            self.assertEqual(subscription_indexer.sync(rpc, self.contract)[0], 2999)
+        self.assertEqual(SubscriptionPayment.objects.get(block_number=5).amount_wei, 5 * 10**15)
+
+    def test_register_verifies_against_indexed_payment(self):
+        from unittest import mock
+
+        from hexbytes import HexBytes
+        from web3 import Web3
+
+        from . import subscription_service
+        from .subscription_indexer import payments_from_logs, store_payments
+
+        store_payments(payments_from_logs([self.purchase_log(7, 10)], self.contract))
+        tx_hash = HexBytes(bytes([7]) * 32).hex()
+        rpc = mock.Mock()
+        service = subscription_service.SubscriptionService(rpc=rpc)
+
+        with mock.patch.object(subscription_service, "CONTRACT_ADDRESS", self.contract):
+            self.assertEqual(
+                service.verify_transaction("0x" + tx_hash[2:].upper(), self.buyer),
+                (True, "Payment verified"),
+            )
+            self.assertFalse(service.verify_transaction(tx_hash, "0x" + "44" * 20)[0])
+            subscription = service.register_subscription("u1", self.buyer, tx_hash)
+        rpc.call.assert_not_called()
+        self.assertEqual(subscription.wallet_address, Web3.to_checksum_address(self.buyer))
+        self.assertTrue(service.is_premium_user("u1"))
+
+
+class ContractReadCacheTests(HabitsTestCase):
+    def test_price_is_read_once_per_ttl(self):
+        import time
+        from unittest import mock
+
+        from eth_abi import encode
+
+        from . import subscription_service
+
+        rpc = mock.Mock()
+        w3 = mock.Mock()
+        w3.eth.call.return_value = encode(["uint256"], [5 * 10**15])
+        rpc.call.side_effect = lambda fn: fn(w3)
+
+        with mock.patch.object(subscription_service, "CONTRACT_ADDRESS", "0x" + "22" * 20):
+            service = subscription_service.SubscriptionService(rpc=rpc)
+        for _ in range(3):
+            self.assertEqual(service.get_subscription_price(), "0.005")
+        self.assertEqual(w3.eth.call.call_count, 1)
+
+        with mock.patch("habits.rpc_client.time.monotonic", return_value=time.monotonic() + 3600):
+            service.get_subscription_price()
+        self.assertEqual(w3.eth.call.call_count, 2)
+
+    def test_concurrent_first_reads_share_one_load(self):
+        import threading
+        import time
+
+        from .rpc_client import TtlCache
+
+        cache = TtlCache(ttl=60)
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.05)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("price", load))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(loads), 1)
+
+
+class AsyncRpcClientTests(HangingRpcNodeMixin, HabitsTestCase):
+    def test_concurrent_calls_share_one_event_loop(self):
+        import asyncio
+        import time
+
+        from .rpc_client import AsyncRpcClient
+
+        client = AsyncRpcClient(["http://slow.invalid", "http://fast.invalid"], hedge_delay=0.05)
+
+        async def block_number(w3):
+            await asyncio.sleep(1 if "slow" in w3.provider.endpoint_uri else 0.1)
+            return 7
+
+        async def many():
+            return await asyncio.gather(*(client.call(block_number) for _ in range(20)))
+
+        started = time.monotonic()
+        self.assertEqual(asyncio.run(many()), [7] * 20)
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_hanging_node_costs_one_timeout(self):
+        import asyncio
+        import time
+        from unittest import mock
+
+        from .rpc_client import AsyncRpcClient, RpcUnavailable
+
+        url = self.start_hanging_node()
+        with mock.patch("habits.rpc_client.RPC_CONNECT_TIMEOUT", 0.5), mock.patch(
+            "habits.rpc_client.RPC_READ_TIMEOUT", 0.5
+        ):
+            client = AsyncRpcClient([url])
+
+        async def block_number(w3):
+            return await w3.eth.block_number
+
+        started = time.monotonic()
+        with self.assertRaises(RpcUnavailable):
+            asyncio.run(client.call(block_number))
+        # aiohttp's total timeout is connect + read, so allow for scheduling
+        self.assertLess(time.monotonic() - started, 1.0 + 0.25)
+        self.assertEqual(len(self.node_connections), 1)
+
+
+class QueryPlanTests(HabitsTestCase):
+    """Hot queries must be answered from an index, never a full table scan"""
+
+    def setUp(self):
+        from .models import XpEvent
+
+        self.habits = [Habit.objects.create(name=f"P{i}", user_id=f"p{i % 3}") for i in range(6)]
+        for h in self.habits:
+            for offset in range(20):
+                day = date(2026, 1, 1) + timedelta(days=offset)
+                CheckIn.objects.create(habit=h, user_id=h.user_id, date=day)
+                XpEvent.objects.create(habit=h, user_id=h.user_id, date=day)
+        for i in range(30):
+            UserStats.objects.create(user_id=f"s{i}", xp_total=i * 10)
+        DailyCheckInCount.rebuild()
+
+    def plan(self, qs):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # tiny tables are cheaper to scan; ask whether an index *can* serve the query
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return qs.explain()
+
+    def assert_indexed(self, qs, sorted_by_index=False):
+        plan = self.plan(qs)
+        lines = plan.splitlines()
+        full_scans = [
+            line for line in lines
+            if "Seq Scan" in line or ("SCAN " in line and "USING" not in line)
+        ]
+        self.assertEqual(full_scans, [], f"full scan in plan:\n{plan}")
+        if sorted_by_index:
+            self.assertNotIn("TEMP B-TREE", plan)
+            self.assertNotRegex(plan, r"(?m)^\W*Sort\b")
+
+    def test_hot_queries_use_indexes(self):
+        from .models import XpEvent, checkin_dates_by_habit
+
+        start, end = date(2026, 1, 5), date(2026, 1, 15)
+        habit = self.habits[0]
+
+        # heatmap / global stats
+        self.assert_indexed(DailyCheckInCount.objects.filter(user_id="p0", date__range=(start, end)))
+        # check-in list pages
+        self.assert_indexed(
+            CheckIn.objects.filter(user_id="p0", date__range=(start, end)).order_by("-date", "-id")[:101],
+            sorted_by_index=True,
+        )
+        # per-habit streaks and stats
+        self.assert_indexed(CheckIn.objects.filter(habit=habit, date__gte=start))
+        self.assert_indexed(
+            CheckIn.objects.filter(habit__in=self.habits[:2]).order_by("habit_id", "date")
+        )
+        self.assertTrue(checkin_dates_by_habit(self.habits[:2]))
+        # XP de-duplication
+        self.assert_indexed(
+            XpEvent.objects.filter(user_id="p0", habit__in=self.habits[:2], date__in=[start, end])
+        )
+        # live leaderboard
+        self.assert_indexed(UserStats.objects.order_by("-xp_total", "user_id")[:11], sorted_by_index=True)
+
+
+class SyntheticDataTests(HabitsTestCase):
+    def test_generated_history_is_consistent_and_has_gaps(self):
+        from . import synthetic_data
+
+        end = date(2026, 6, 30)
+        counts = synthetic_data.generate(3, 2, 1, seed=7, end=end)
+
+        users = synthetic_data.synthetic_user_ids()
+        self.assertEqual(len(users), 3)
+        self.assertEqual(Habit.objects.filter(user_id__in=users).count(), 6)
+        self.assertEqual(CheckIn.objects.filter(user_id__in=users).count(), counts["checkins"])
+        # the snapshot is left to the periodic refresh unless asked for
+        self.assertFalse(LeaderboardEntry.objects.exists())
+
+        for habit in Habit.objects.filter(user_id__in=users):
+            dates = list(habit.checkins.order_by("date").values_list("date", flat=True))
+            self.assertTrue(dates)
+            self.assertLessEqual(dates[-1], end)
+            self.assertLess(len(dates), (dates[-1] - dates[0]).days + 1)  # not every day
+
+        totals = sum(DailyCheckInCount.objects.filter(user_id__in=users).values_list("count", flat=True))
+        self.assertEqual(totals, counts["checkins"])
+
+        synthetic_data.generate(1, 1, 1, seed=8, end=end, refresh_leaderboard=True)
+        self.assertEqual(LeaderboardEntry.objects.count(), 4)
+
+        synthetic_data.clear()
+        self.assertFalse(CheckIn.objects.filter(user_id__in=users).exists())
+        self.assertEqual(synthetic_data.synthetic_user_ids(), [])
+
+    def test_benchmark_reports_percentiles_and_queries(self):
+        from . import benchmark
+
+        report = benchmark.run([(2, 1, 0.2)], iterations=3, only=["habits", "checkin_post", "leaderboard"])
+
+        (size,) = report["sizes"]
+        self.assertEqual(set(size["endpoints"]), {"habits", "checkin_post", "leaderboard"})
+        for result in size["endpoints"].values():
+            self.assertEqual(result["iterations"], 3)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["queries"]["max"], 0)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 50), 2)
+
+
+class MetricsTests(SignedTokenMixin, HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.use_signed_tokens()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.mint('m1')}")
+        Habit.objects.create(name="Run", user_id="m1")
+
+    def test_requests_are_recorded_per_route(self):
+        from config import metrics
+
+        before = metrics.requests_total.value("habit-list", "GET", "200")
+        queries_before = metrics.request_queries.totals("habit-list")
+        firebase_before = metrics.request_external_duration.totals("habit-list", "firebase")[0]
+
+        self.assertEqual(self.client.get("/api/habits/").status_code, 200)
+
+        self.assertEqual(metrics.requests_total.value("habit-list", "GET", "200"), before + 1)
+        count, total = metrics.request_queries.totals("habit-list")
+        self.assertEqual(count, queries_before[0] + 1)
+        self.assertGreater(total, queries_before[1])
+        self.assertEqual(metrics.request_external_duration.totals("habit-list", "firebase")[0], firebase_before + 1)
+
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('http_requests_total{route="habit-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="habit-list",method="GET",le="+Inf"}', body)
+        self.assertIn("# TYPE http_request_db_queries histogram", body)
+
+    def test_async_views_and_streamed_responses_are_measured(self):
+        from config import metrics
+
+        queries_before = metrics.request_queries.totals("leaderboard")
+        self.assertEqual(self.client.get("/api/leaderboard/").status_code, 200)
+        count, total = metrics.request_queries.totals("leaderboard")
+        self.assertEqual(count, queries_before[0] + 1)
+        self.assertGreater(total, queries_before[1])
+
+        sizes_before = metrics.response_size.totals("heatmap")
+        resp = self.client.get("/api/heatmap/", {"from": "2026-01-01", "to": "2026-01-31", "encoding": "compact"})
+        body = b"".join(resp.streaming_content)
+        self.assertEqual(metrics.response_size.totals("heatmap"), (sizes_before[0] + 1, sizes_before[1] + len(body)))
+
+    def test_metrics_token_is_enforced(self):
+        from django.test import override_settings
+
+        with override_settings(METRICS_TOKEN="scrape-me"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            self.client.credentials(HTTP_AUTHORIZATION="Bearer scrape-me")
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class QueryBudgetTests(HabitsTestCase):
+    def test_views_stay_within_budget_as_data_grows(self):
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+        from .checkin_service import record_checkins
+
+        client = APIClient()
+        client.force_authenticate(user=FirebaseUser(uid="qb"))
+        today = timezone.localdate()
+        for n in range(4):
+            habit = Habit.objects.create(name=f"H{n}", user_id="qb")
+            record_checkins("qb", [(habit.pk, today - timedelta(days=d)) for d in range(0, 30, n + 1)])
+
+        # budgets raise in these tests, so a 200 means the view fit
+        for path in (
+            "/api/habits/",
+            "/api/checkins/",
+            f"/api/heatmap/?from={today - timedelta(days=60)}&to={today}",
+            "/api/stats/",
+            f"/api/stats/?habit_id={habit.pk}&granularity=week",
+            "/api/xp/",
+            "/api/leaderboard/me/",
+        ):
+            self.assertEqual(client.get(path).status_code, 200, path)
+
+    def test_exceeding_budget_raises_or_logs_the_statements(self):
+        from django.test import override_settings
+        from .api.query_budget import QueryBudgetExceeded, query_budget
+
+        @query_budget(1)
+        def chatty():
+            list(Habit.objects.all())
+            list(CheckIn.objects.all())
+            return "done"
+
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "chatty ran 2 queries, budget is 1"):
+                chatty()
+        with override_settings(QUERY_BUDGET_RAISE=False):
+            with self.assertLogs("habits.api.query_budget", "WARNING") as logs:
+                self.assertEqual(chatty(), "done")
+        self.assertIn('FROM "habits_checkin"', logs.output[0])
+
+    def test_async_views_count_queries_run_in_threads(self):
+        from asgiref.sync import async_to_sync, sync_to_async
+        from django.test import override_settings
+        from .api.query_budget import QueryBudgetExceeded, query_budget
+
+        @query_budget(1)
+        async def chatty():
+            await Habit.objects.acount()
+            await sync_to_async(lambda: list(CheckIn.objects.all()))()
+
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                async_to_sync(chatty)()
+
+
+class LoggingTests(HabitsTestCase):
+    def make_logger(self, handler, *filters):
+        import logging
+
+        logger = logging.getLogger(f"habits.tests.logging.{self._testMethodName}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        for f in filters:
+            logger.addFilter(f)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_background_handler_writes_json_lines(self):
+        import io
+        import json
+
+        from config.log import BackgroundHandler, JsonFormatter
+
+        stream = io.StringIO()
+        handler = BackgroundHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        self.addCleanup(handler.close)
+        logger = self.make_logger(handler)
+
+        args = ["u1"]
+        logger.info("verified uid=%s", args, extra={"route": "heatmap"})
+        args.append("changed after the call")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+        handler.flush()
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(first["message"], "verified uid=['u1']")
+        self.assertEqual((first["level"], first["route"]), ("INFO", "heatmap"))
+        self.assertEqual(first["logger"], logger.name)
+        self.assertIn("ValueError: boom", second["exception"])
+
+    def test_sampling_counts_per_message_and_keeps_warnings(self):
+        import logging
+
+        from config.log import SamplingFilter
+
+        records = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        logger = self.make_logger(Collect(), SamplingFilter(every=5))
+        for i in range(10):
+            logger.info("token verified uid=%s", i)
+        logger.info("keys loaded")
+        logger.warning("verification failed")
+        logger.warning("verification failed")
+
+        messages = [r.getMessage() for r in records]
+        self.assertEqual(
+            messages,
+            ["token verified uid=0", "token verified uid=5", "keys loaded", "verification failed", "verification failed"],
+        )
+        self.assertEqual(records[0].sample_rate, 5)
+        self.assertFalse(hasattr(records[-1], "sample_rate"))
+
+
+class ExportTests(HabitsTestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+        from .checkin_service import record_checkins
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=FirebaseUser(uid="ex"))
+        self.habits = [Habit.objects.create(name=f'Read, "daily" {n}', user_id="ex") for n in range(2)]
+        today = timezone.localdate()
+        record_checkins("ex", [(h.pk, today - timedelta(days=d)) for h in self.habits for d in range(5)])
+        Habit.objects.create(name="Not mine", user_id="other")
+
+    def body(self, resp):
+        self.assertTrue(resp.streaming)
+        return b"".join(resp.streaming_content).decode()
+
+    def test_ndjson_streams_every_row_in_batches(self):
+        import json
+        from unittest import mock
+
+        from . import export
+
+        with mock.patch.object(export, "EXPORT_CHUNK_SIZE", 3), mock.patch.object(export, "EXPORT_BATCH_ROWS", 4):
+            resp = self.client.get("/api/export/")
+            self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+            self.assertIn("attachment;", resp["Content-Disposition"])
+            rows = [json.loads(line) for line in self.body(resp).splitlines()]
+
+        kinds = [row["type"] for row in rows]
+        self.assertEqual(kinds, ["habit"] * 2 + ["checkin"] * 10 + ["xp_event"] * 10)
+        self.assertEqual(rows[0]["name"], 'Read, "daily" 0')
+        self.assertEqual({row["habit_id"] for row in rows[2:]}, {h.pk for h in self.habits})
+
+    def test_csv_and_async_generator_match(self):
+        import csv
+        import io
+
+        from asgiref.sync import async_to_sync
+
+        from .export import aexport_rows, export_rows
+
+        body = self.body(self.client.get("/api/export/", {"output": "csv"}))
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 22)
+        self.assertEqual((rows[1]["type"], rows[1]["name"]), ("habit", 'Read, "daily" 1'))
+        self.assertEqual(rows[-1]["type"], "xp_event")
+
+        async def collect():
+            return "".join([part async for part in aexport_rows("ex", "csv")])
+
+        self.assertEqual(async_to_sync(collect)(), "".join(export_rows("ex", "csv")))
+        self.assertEqual(self.client.get("/api/export/", {"output": "xml"}).status_code, 400)
+
+
+class CheckInImportTests(HabitsTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=FirebaseUser(uid="im"))
+
+    def post_csv(self, text):
+        return self.client.generic("POST", "/api/checkins/import/", text.encode(), content_type="text/csv")
+
+    def test_import_creates_habits_and_derived_state_once(self):
+        from .models import XpEvent
+
+        Habit.objects.create(name="Read", user_id="im")
+        lines = ["Habit,Date,Color"]
+        lines += [f"Read,2026-01-{d:02d}," for d in range(1, 11)]
+        lines += [f"Run,2026-01-{d:02d},#40c463" for d in (1, 2, 3, 5)]
+        lines += ["Run,2026-01-02,", ""]  # duplicate and blank line
+
+        resp = self.post_csv("\n".join(lines))
+
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual(
+            resp.json(), {"rows": 15, "habits_created": 1, "created": 14, "skipped": 1, "xp_awarded": 200}
+        )
+        read, run = Habit.objects.get(name="Read"), Habit.objects.get(name="Run")
+        self.assertEqual((read.longest_run, run.longest_run, run.color), (10, 3, "#40c463"))
+        self.assertEqual(XpEvent.objects.filter(user_id="im").count(), 14)
+        self.assertEqual(UserStats.objects.get(user_id="im").xp_total, 200)
+        self.assertEqual(DailyCheckInCount.objects.get(user_id="im", date=date(2026, 1, 2)).count, 2)
+
+        # importing the same file again changes nothing
+        self.assertEqual(self.post_csv("\n".join(lines)).json()["created"], 0)
+
+    def test_export_round_trips_through_multipart_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from rest_framework.test import APIClient
+        from config.firebase_auth import FirebaseUser
+
+        self.post_csv("habit,date\nRead,2026-02-01\nRead,2026-02-02\nWalk,2026-02-02\n")
+        exported = b"".join(self.client.get("/api/export/", {"output": "csv"}).streaming_content)
+
+        other = APIClient()
+        other.force_authenticate(user=FirebaseUser(uid="im2"))
+        resp = other.post("/api/checkins/import/", {"file": SimpleUploadedFile("export.csv", exported)})
+
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual((resp.json()["habits_created"], resp.json()["created"]), (2, 3))
+        self.assertEqual(
+            sorted(CheckIn.objects.filter(user_id="im2").values_list("habit__name", "date")),
+            sorted(CheckIn.objects.filter(user_id="im").values_list("habit__name", "date")),
+        )
+
+    def test_bad_rows_and_habit_limit_import_nothing(self):
+        from .subscription_service import FREE_TIER_LIMIT
+
+        resp = self.post_csv("habit,date\nRead,2026-01-01\nRead,2026-13-01\n")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("Line 3", resp.json()["detail"])
+
+        rows = "\n".join(f"H{n},2026-01-01" for n in range(FREE_TIER_LIMIT + 1))
+        resp = self.post_csv("habit,date\n" + rows)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("free tier limit", resp.json()["detail"])
+
+        self.assertFalse(Habit.objects.filter(user_id="im").exists())
+        self.assertFalse(CheckIn.objects.filter(user_id="im").exists())
+        self.assertEqual(self.post_csv("date\n2026-01-01\n").status_code, 400)
+
+    def test_file_is_read_before_touching_the_database(self):
+        from .checkin_import import CheckInImportError, import_checkins
+
+        lines = ["habit,date\n"] + [f"Read,2026-01-{d:02d}\n" for d in range(1, 29)] + ["Read,soon\n"]
+        # a bad last line fails before any query, so no transaction or lock was held
+        with self.assertNumQueries(0), self.assertRaises(CheckInImportError):
+            import_checkins("im", iter(lines))
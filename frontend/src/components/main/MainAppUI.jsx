@@ -2,6 +2,7 @@ import { useState, useEffect, useCallback, useRef } from "react";
 import { gsap } from "gsap";
 import { useTranslation } from "react-i18next";
 import { apiFetch } from "../../utils/api";
+import { expandCompactHeatmap } from "../../utils/heatmap";
 import { useAuth } from "../../contexts/AuthContext";
 import {
   todayStr,
@@ -49,18 +50,22 @@ export default function MainAppUI() {
   // ── Data fetching ──────────────────────────────────────────
   const refresh = useCallback(async () => {
     const { fromStr, toStr } = getDateRange365();
+    const today = todayStr();
 
     try {
       const [h, c, hm, st, lb, xp] = await Promise.all([
         apiFetch("/habits/"),
-        apiFetch("/checkins/"),
-        apiFetch(`/heatmap/?from=${fromStr}&to=${toStr}`),
+        // only today's check-ins drive the toggles
+        apiFetch(`/checkins/?from=${today}&to=${today}&limit=500`),
+        apiFetch(`/heatmap/?from=${fromStr}&to=${toStr}&encoding=compact`).then(
+          expandCompactHeatmap,
+        ),
         apiFetch("/stats/"),
         apiFetch("/leaderboard/"),
         apiFetch("/xp/"),
       ]);
       setHabits(h);
-      setCheckins(c);
+      setCheckins(c.results);
       setHeatmapData(hm);
       setStats(st);
       setLeaderboardData(lb.results || []);
@@ -81,7 +86,9 @@ export default function MainAppUI() {
       } else {
         ({ fromStr, toStr } = getDateRangeForYear(yearOrLast365));
       }
-      const hm = await apiFetch(`/heatmap/?from=${fromStr}&to=${toStr}`);
+      const hm = expandCompactHeatmap(
+        await apiFetch(`/heatmap/?from=${fromStr}&to=${toStr}&encoding=compact`),
+      );
       setHeatmapData(hm);
     } catch (err) {
       console.error("Failed to fetch heatmap:", err);
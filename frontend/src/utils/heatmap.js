@@ -0,0 +1,21 @@
+// ─────────────────────────────────────────────────────────────
+// Compact Heatmap Decoding
+// ─────────────────────────────────────────────────────────────
+
+// Expand `/heatmap/?encoding=compact` responses into [{ date, count }].
+// Each chunk packs `days` consecutive days from `start` as base64: either a
+// bitset (bit i % 8 of byte i / 8) or one byte per day.
+export function expandCompactHeatmap(payload) {
+  const result = [];
+  (payload?.chunks || []).forEach((chunk) => {
+    const bytes = Uint8Array.from(atob(chunk.data), (c) => c.charCodeAt(0));
+    const [year, month, day] = chunk.start.split("-").map(Number);
+    for (let i = 0; i < chunk.days; i++) {
+      const count =
+        chunk.encoding === "bitset" ? (bytes[i >> 3] >> (i & 7)) & 1 : bytes[i];
+      const date = new Date(Date.UTC(year, month - 1, day + i));
+      result.push({ date: date.toISOString().slice(0, 10), count });
+    }
+  });
+  return result;
+}
@@ -0,0 +1,37 @@
+const hre = require("hardhat");
+const fs = require("fs");
+const path = require("path");
+
+// Buys a subscription from a local signer, e.g. to exercise the backend's
+// `python manage.py index_subscriptions` against `npx hardhat node`:
+//   npx hardhat run scripts/purchase.js --network localhost
+// BUYER_INDEX selects the signer (default 1, the deployer is 0).
+async function main() {
+  const network = await hre.ethers.provider.getNetwork();
+  const networkName = network.name === "unknown" ? "localhost" : network.name;
+  const deployments = JSON.parse(fs.readFileSync(path.join(__dirname, "../deployments.json"), "utf8"));
+  const address = deployments[networkName] && deployments[networkName].HabitFlowSubscription;
+  if (!address) {
+    throw new Error(`No HabitFlowSubscription deployment for ${networkName}; run deploy first`);
+  }
+
+  const signers = await hre.ethers.getSigners();
+  const buyer = signers[Number(process.env.BUYER_INDEX || 1)];
+  const subscription = await hre.ethers.getContractAt("HabitFlowSubscription", address, buyer);
+  const price = await subscription.subscriptionPrice();
+
+  const tx = await subscription.purchaseSubscription({ value: price });
+  const receipt = await tx.wait();
+
+  console.log(`Buyer:   ${buyer.address}`);
+  console.log(`Paid:    ${hre.ethers.formatEther(price)} ETH`);
+  console.log(`Tx hash: ${tx.hash}`);
+  console.log(`Block:   ${receipt.blockNumber}`);
+}
+
+main()
+  .then(() => process.exit(0))
+  .catch((error) => {
+    console.error(error);
+    process.exit(1);
+  });